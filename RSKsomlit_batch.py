@@ -0,0 +1,282 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Script file name: RSKsomlit_batch.py
+Author: Etienne Poirier, IRD, Plouzané
+Date created: 2026-10-18
+Last update: 2026-10-18
+Description: command line entry point to process the RBR Maestro files of a
+directory tree without the streamlit page, e.g. from a cron job.
+Every folder of the tree holding raw .rsk files is scanned and split by day
+(scan_rsk) or by profile (export_profiles2rsk), then the days are processed
+(process_rsk_folder) into SOMLIT files in its proc_data/outputs folder.
+
+Exit status is 0 when every day is processed, 1 when at least one day
+failed or a raw file could not be split, the other folders being processed
+anyway.
+
+usage example:
+    python RSKsomlit_batch.py /data/somlit/2025 --site-id 5 --workers 4
+"""
+import argparse
+import importlib.util
+import os
+import sys
+import traceback
+
+# no display on a processing server
+os.environ.setdefault("MPLBACKEND", "Agg")
+
+import RSKsomlit_proc as rsksproc
+from sites import sites
+
+# default channels, same as the streamlit page
+DEFAULT_PARAM = ['conductivity',
+                 'temperature',
+                 'temperature1',
+                 'dissolved_o2_concentration',
+                 'par',
+                 'ph',
+                 'chlorophyll-a',
+                 'fdom',
+                 'turbidity',
+                 'depth',
+                 'salinity',
+                 'density_anomaly',
+                 'dissolved_o2_compensated',
+                 'temperature1_compensated'
+                 ]
+
+
+# %% find_raw_folders
+def find_raw_folders(root):
+    """
+    Lists the folders of the tree under root holding raw .rsk files, the
+    proc_data folders made by the processing are left out.
+
+    Parameters
+    ----------
+    root : str
+        top folder of the tree
+
+    Returns
+    -------
+    folders : List
+        sorted list of the folders with .rsk files
+
+    """
+    folders = []
+    for dirpath, dirnames, filenames in os.walk(root):
+        dirnames[:] = sorted(d for d in dirnames if d != "proc_data")
+        if any(f.lower().endswith(".rsk") for f in filenames):
+            folders.append(dirpath)
+    return folders
+
+
+# %% print_progress
+def print_progress(done, total, result):
+    """
+    Progress callback of process_rsk_folder, one line per day on stderr so
+    that it stays readable when stdout is redirected to a log.
+    """
+    if result["skipped"]:
+        status = "skipped"
+    elif result["success"]:
+        status = "ok"
+    else:
+        status = f"FAILED ({result['error']})"
+    print(f"[{done}/{total}] {os.path.basename(result['file'])}: {status}",
+          file=sys.stderr, flush=True)
+
+
+# %% split_failure
+def split_failure(path, error):
+    """
+    Result of a raw file or folder that could not be scanned or split, in
+    the format of the results of process_rsk_folder, reported on stderr.
+    """
+    print(f"{path}: FAILED to split ({type(error).__name__}: {error})",
+          file=sys.stderr, flush=True)
+    return {
+        "file": path,
+        "output_folder": None,
+        "success": False,
+        "skipped": False,
+        "error": f"{type(error).__name__}: {error}",
+        "traceback": traceback.format_exc(),
+        "figure_errors": [],
+    }
+
+
+# %% process_tree
+def process_tree(root, site_id, patm, p_tresh, c_tresh, param, mode="scan",
+                 workers=1, figure_workers=0, figures="channel", fmt="csv",
+                 dataset_dir=None, force=False, profile=False, profiles="best"):
+    """
+    Runs the scan, split, process and SOMLIT export chain on every folder of
+    the tree with raw .rsk files. A raw file (mode "profiles") or a folder
+    (mode "scan") that cannot be split, e.g. a corrupt .rsk, is counted as a
+    failure and the run goes on with the others.
+
+    Parameters
+    ----------
+    root : str
+        top folder of the tree
+    site_id, patm, p_tresh, c_tresh, param :
+        processing parameters, cf. process_rsk_folder
+    mode : str, optional
+        "scan" splits the raw files by day with scan_rsk, "profiles" exports
+        each profile of each raw file with export_profiles2rsk.
+        The default is "scan".
+    workers, figure_workers, figures, force, profile, profiles :
+        cf. process_rsk_folder
+    fmt : str, optional
+        Outputs written beside the SOMLIT files: "csv" the RBR csv files of
+        the casts, "parquet" the binned casts in a Parquet dataset, "somlit"
+        nothing else. The default is "csv".
+    dataset_dir : str, optional
+        Parquet dataset folder used with fmt "parquet", the default is
+        dataset/ in the proc_data folder of each folder processed.
+
+    Returns
+    -------
+    results : List
+        results of process_rsk_folder of all the folders, and the failures
+        of the split, cf. split_failure
+
+    """
+    results = []
+    folders = find_raw_folders(root)
+    if not folders:
+        print(f"No .rsk file found under {root}", file=sys.stderr)
+        return results
+
+    for n, folder in enumerate(folders, start=1):
+        print(f"=== Folder {n}/{len(folders)}: {folder}", file=sys.stderr, flush=True)
+        proc_data_dir = os.path.join(folder, "proc_data")
+
+        if mode == "profiles":
+            os.makedirs(proc_data_dir, exist_ok=True)
+            files_to_process = []
+            for name in sorted(os.listdir(folder)):
+                if name.lower().endswith(".rsk"):
+                    raw_file = os.path.join(folder, name)
+                    try:
+                        files_to_process += rsksproc.export_profiles2rsk(
+                            raw_file, proc_data_dir
+                        )
+                    except Exception as e:
+                        results.append(split_failure(raw_file, e))
+        else:
+            try:
+                files_to_process = rsksproc.scan_rsk(folder)
+            except Exception as e:
+                results.append(split_failure(folder, e))
+                continue
+
+        if fmt == "parquet":
+            folder_dataset_dir = dataset_dir or os.path.join(proc_data_dir, "dataset")
+        else:
+            folder_dataset_dir = None
+
+        results += rsksproc.process_rsk_folder(
+            path_in=proc_data_dir,
+            list_of_rsk=files_to_process,
+            site_id=site_id,
+            p_tresh=p_tresh,
+            c_tresh=c_tresh,
+            patm=patm,
+            param=param,
+            workers=workers,
+            force=force,
+            export_csv=(fmt == "csv"),
+            dataset_dir=folder_dataset_dir,
+            figures=figures,
+            figure_workers=figure_workers,
+            progress=print_progress,
+            profile=profile,
+            profiles=profiles,
+        )
+    return results
+
+
+# %% main
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Process the RBR Maestro .rsk files of a directory tree "
+                    "into SOMLIT files."
+    )
+    parser.add_argument("root", help="top folder of the tree with the raw .rsk files")
+    parser.add_argument("--site-id", type=int, required=True,
+                        choices=[s["id"] for s in sites],
+                        help="SOMLIT site id, cf. sites.py")
+    parser.add_argument("--patm", type=float, default=10.1325,
+                        help="atmospheric pressure (dbar), default 10.1325")
+    parser.add_argument("--p-tresh", type=float, default=0.4,
+                        help="pressure threshold (dbar) of the profile detection, default 0.4")
+    parser.add_argument("--c-tresh", type=float, default=5.0,
+                        help="conductivity threshold (mS/cm) of the profile detection, default 5")
+    parser.add_argument("--channels", default=",".join(DEFAULT_PARAM),
+                        help="comma separated channels to keep, default the channels of the web page")
+    parser.add_argument("--mode", choices=["scan", "profiles"], default="scan",
+                        help="split the raw files by day (scan) or by profile (profiles), default scan")
+    parser.add_argument("--workers", type=int, default=1,
+                        help="processes used for the days, default 1")
+    parser.add_argument("--figure-workers", type=int, default=0,
+                        help="processes rendering the per-channel figures apart, "
+                             "not with --figures batch, default 0 (inline)")
+    parser.add_argument("--figures", choices=["channel", "batch", "none"], default="channel",
+                        help="one figure per channel, one figure per day or no figure, default channel")
+    parser.add_argument("--format", dest="fmt", choices=["csv", "parquet", "somlit"], default="csv",
+                        help="outputs beside the SOMLIT files: RBR csv files, a Parquet dataset "
+                             "or nothing, default csv")
+    parser.add_argument("--dataset-dir",
+                        help="Parquet dataset folder with --format parquet, default proc_data/dataset")
+    parser.add_argument("--force", action="store_true",
+                        help="reprocess the days already in the run manifest")
+    parser.add_argument("--profiles", choices=["best", "all"], default="best",
+                        help="process the deepest profile of each day (best) or every "
+                             "valid profile (all), default best")
+    parser.add_argument("--profile", action="store_true",
+                        help="profile the processing stages, report in each output folder")
+    args = parser.parse_args(argv)
+
+    if not os.path.isdir(args.root):
+        parser.error(f"{args.root} is not a folder")
+    if args.figures == "batch" and args.figure_workers > 0:
+        parser.error("--figures batch is drawn inline, it cannot be used with --figure-workers")
+    # checked once here rather than failing every day
+    if args.fmt == "parquet" and importlib.util.find_spec("pyarrow") is None:
+        parser.error("--format parquet needs pyarrow: pip install pyarrow")
+
+    results = process_tree(
+        args.root,
+        site_id=args.site_id,
+        patm=args.patm,
+        p_tresh=args.p_tresh,
+        c_tresh=args.c_tresh,
+        param=[c.strip() for c in args.channels.split(",") if c.strip()],
+        mode=args.mode,
+        workers=args.workers,
+        figure_workers=args.figure_workers,
+        figures=args.figures,
+        fmt=args.fmt,
+        dataset_dir=args.dataset_dir,
+        force=args.force,
+        profile=args.profile,
+        profiles=args.profiles,
+    )
+
+    if args.profile:
+        reports = [r["profile"] for r in results if r.get("profile")]
+        print(rsksproc.summarize_profiles(reports).to_string(index=False), file=sys.stderr)
+
+    failed = [r for r in results if not r["success"]]
+    print(f"{len(results)} result(s), {len(failed)} failed", file=sys.stderr)
+    for r in failed:
+        print(f" - {r['file']}: {r['error']}", file=sys.stderr)
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
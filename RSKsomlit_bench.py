@@ -0,0 +1,285 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Script file name: RSKsomlit_bench.py
+Author: Etienne Poirier, IRD, Plouzané
+Date created: 2026-10-18
+Last update: 2026-10-18
+Description: benchmark of the processing stages on synthetic RSK files
+(RSKsomlit_synth.py) of several sizes. For each size and stage the wall
+time, CPU time and peak memory are written in a JSON file, to be compared
+with the JSON of another commit with --compare.
+
+Stages: synthetic_rsk (writing the raw file), scan_rsk, split_rsk_by_day
+and export_profiles2rsk on the raw file, procRSK on its first day, then the
+SOMLIT export of the downcast: toSomlitDB_from_array from the binned data in
+memory, as process_rsk_file does, and toSomlitDB from the RBR csv file for
+comparison.
+
+usage example:
+    python RSKsomlit_bench.py --days 1,7,30 --output bench_new.json
+    python RSKsomlit_bench.py --days 1,7,30 --compare bench_old.json
+"""
+import argparse
+import json
+import os
+import platform
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime
+
+# no display needed
+os.environ.setdefault("MPLBACKEND", "Agg")
+
+import numpy as np
+
+import RSKsomlit_proc as rsksproc
+from RSKsomlit_synth import PATM, synthetic_rsk
+
+# channels of the synthetic files and the ones derived by procRSK, the
+# default channels of the web page and of RSKsomlit_batch.py
+PARAM = ['conductivity',
+         'temperature',
+         'temperature1',
+         'dissolved_o2_concentration',
+         'par',
+         'ph',
+         'chlorophyll-a',
+         'fdom',
+         'turbidity',
+         'depth',
+         'salinity',
+         'density_anomaly',
+         'dissolved_o2_compensated',
+         'temperature1_compensated'
+         ]
+SITE_ID = 5
+P_TRESH = 0.4
+C_TRESH = 5
+
+
+# %% measure
+def measure(func, *args, memory=True, clean_dir=None, **kwargs):
+    """
+    Runs func(*args, **kwargs) and measures it. With memory the stage is run
+    a second time under tracemalloc for the peak of the memory allocated,
+    so that the tracing overhead does not count in the timings.
+    clean_dir, the output folder of the stage, is emptied before each run
+    as RSK2RSK does not overwrite files.
+
+    Returns
+    -------
+    result :
+        what func returns, from the first run
+    stats : dict
+        wall_s, cpu_s, peak_mb (None without memory) and maxrss_mb, the
+        high water mark of the process so far
+
+    """
+    def clean():
+        if clean_dir is not None:
+            shutil.rmtree(clean_dir, ignore_errors=True)
+            os.makedirs(clean_dir)
+
+    clean()
+    wall = time.perf_counter()
+    cpu = time.process_time()
+    result = func(*args, **kwargs)
+    stats = {
+        "wall_s": round(time.perf_counter() - wall, 4),
+        "cpu_s": round(time.process_time() - cpu, 4),
+        "peak_mb": None,
+    }
+    if memory:
+        clean()
+        tracemalloc.start()
+        try:
+            func(*args, **kwargs)
+            stats["peak_mb"] = round(tracemalloc.get_traced_memory()[1] / 2**20, 2)
+        finally:
+            tracemalloc.stop()
+    # kB on Linux
+    stats["maxrss_mb"] = round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1)
+    return result, stats
+
+
+# %% bench_size
+def bench_size(work_dir, days, hz, hours, profiles, false_casts, memory=True):
+    """
+    Runs the stages on a synthetic deployment of days days in work_dir.
+
+    A stage that raises is recorded with its error and no timing, the
+    stages needing its result are recorded as skipped and the others still
+    run.
+
+    Returns
+    -------
+    results : List
+        one dictionnary per stage, the size and the stats of measure, or
+        the error of the stage
+
+    """
+    size = {"days": days, "hz": hz, "hours": hours, "profiles": profiles,
+            "false_casts": false_casts,
+            # rows of the raw file, as made by synthetic_data
+            "samples": int(hours * 3600 * 1000) // int(round(1000 / hz)) * days}
+    results = []
+
+    failed = {"wall_s": None, "cpu_s": None, "peak_mb": None, "maxrss_mb": None}
+
+    def stage(name, func, *args, clean_dir=None, needs=()):
+        print(f"--- {days} day(s): {name}", file=sys.stderr, flush=True)
+        if any(n is None for n in needs):
+            results.append({**size, "stage": name, **failed,
+                            "error": "skipped, an earlier stage failed"})
+            return None
+        try:
+            result, stats = measure(func, *args, memory=memory, clean_dir=clean_dir)
+        except Exception as e:
+            print(f"!!! {name} failed: {type(e).__name__}: {e}", file=sys.stderr, flush=True)
+            results.append({**size, "stage": name, **failed,
+                            "error": f"{type(e).__name__}: {e}"})
+            return None
+        results.append({**size, "stage": name, **stats, "error": None})
+        return result
+
+    raw_dir = os.path.join(work_dir, f"raw_{days}d")
+    os.makedirs(raw_dir, exist_ok=True)
+    raw_file = os.path.join(raw_dir, "synth.rsk")
+    raw = stage("synthetic_rsk", lambda: synthetic_rsk(
+        raw_file, days=days, hz=hz, hours=hours, profiles=profiles,
+        false_casts=false_casts), clean_dir=raw_dir)
+
+    stage("scan_rsk", rsksproc.scan_rsk, raw_dir, needs=[raw])
+
+    split_dir = os.path.join(work_dir, f"split_{days}d")
+    day_files = stage("split_rsk_by_day", rsksproc.split_rsk_by_day, raw_file,
+                      split_dir, clean_dir=split_dir, needs=[raw])
+
+    profiles_dir = os.path.join(work_dir, f"profiles_{days}d")
+    stage("export_profiles2rsk", rsksproc.export_profiles2rsk, raw_file,
+          profiles_dir, clean_dir=profiles_dir, needs=[raw])
+
+    out_dir = os.path.join(work_dir, f"outputs_{days}d")
+    proc = stage("procRSK", lambda: rsksproc.procRSK(
+        os.path.join(split_dir, day_files[0]), PATM, SITE_ID, P_TRESH, C_TRESH,
+        PARAM, out_dir), clean_dir=out_dir, needs=[day_files])
+    proc = proc or [None] * 8
+    rsk_d, profile_nb, csv_d = proc[2], proc[4], proc[-2]
+    # the SOMLIT export of the pipeline, cf. process_rsk_file
+    stage("toSomlitDB_from_array", lambda: rsksproc.toSomlitDB_from_array(
+        *rsksproc.rsk_cast_to_array(rsk_d, PARAM, profile_nb), SITE_ID,
+        os.path.join(out_dir, "somlit_down_array.csv")), needs=[rsk_d])
+    # the former export, parsing the RBR csv file again
+    stage("toSomlitDB", rsksproc.toSomlitDB, csv_d, SITE_ID,
+          os.path.join(out_dir, "somlit_down.csv"), needs=[csv_d])
+
+    return results
+
+
+# %% run_info
+def run_info():
+    """
+    Commit and versions the benchmark ran with.
+    """
+    try:
+        commit = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            cwd=os.path.dirname(os.path.abspath(__file__)),
+            capture_output=True, text=True, check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    import pandas as pd
+    import pyrsktools
+
+    return {
+        "commit": commit,
+        "date": datetime.now().isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "numpy": np.__version__,
+        "pandas": pd.__version__,
+        "pyrsktools": pyrsktools.__version__,
+    }
+
+
+# %% compare
+def compare(new, old):
+    """
+    Prints the ratio new/old of the wall time and memory peak of the stages
+    found in both benchmarks.
+    """
+    key = lambda r: (r["days"], r["hz"], r["hours"], r["stage"])
+    # failed stages have no timing to compare
+    old_results = {key(r): r for r in old["results"] if r["wall_s"] is not None}
+    print(f"{'days':>5} {'stage':<22} {'wall old':>9} {'wall new':>9} {'ratio':>6}"
+          f" {'peak old':>9} {'peak new':>9} {'ratio':>6}")
+    for r in new["results"]:
+        o = old_results.get(key(r))
+        if o is None or r["wall_s"] is None:
+            continue
+        wall_ratio = r["wall_s"] / o["wall_s"] if o["wall_s"] else float("nan")
+        if r["peak_mb"] is not None and o["peak_mb"]:
+            peak = f"{o['peak_mb']:>9.1f} {r['peak_mb']:>9.1f} {r['peak_mb'] / o['peak_mb']:>6.2f}"
+        else:
+            peak = ""
+        print(f"{r['days']:>5} {r['stage']:<22} {o['wall_s']:>9.3f} {r['wall_s']:>9.3f}"
+              f" {wall_ratio:>6.2f} {peak}")
+
+
+# %% main
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Benchmark of the processing stages on synthetic RSK files."
+    )
+    parser.add_argument("--days", default="1,7,30",
+                        help="comma separated sizes in days, default 1,7,30")
+    parser.add_argument("--hz", type=float, default=8, help="sampling rate, default 8 Hz")
+    parser.add_argument("--hours", type=float, default=2.0,
+                        help="recording window of each day (h), default 2, 24 for continuous")
+    parser.add_argument("--profiles", type=int, default=1, help="profiles per day, default 1")
+    parser.add_argument("--false-casts", type=int, default=4,
+                        help="swell false casts per day, default 4")
+    parser.add_argument("--no-memory", action="store_true",
+                        help="timings only, the stages are not run again under tracemalloc")
+    parser.add_argument("--workdir", help="folder for the files, kept, default a temporary folder")
+    parser.add_argument("--output", default="benchmark.json",
+                        help="JSON file of the results, default benchmark.json")
+    parser.add_argument("--compare", help="JSON file of a previous benchmark to compare with")
+    args = parser.parse_args(argv)
+
+    work_dir = args.workdir or tempfile.mkdtemp(prefix="rsk_bench_")
+    os.makedirs(work_dir, exist_ok=True)
+    bench = {"info": run_info(), "results": []}
+    try:
+        for days in [int(d) for d in args.days.split(",")]:
+            bench["results"] += bench_size(work_dir, days, args.hz, args.hours,
+                                           args.profiles, args.false_casts,
+                                           memory=not args.no_memory)
+            # written after each size, the sizes done are kept if a later
+            # one is interrupted
+            with open(args.output, "w") as f:
+                json.dump(bench, f, indent=2)
+    finally:
+        if not args.workdir:
+            shutil.rmtree(work_dir, ignore_errors=True)
+    print(f"Benchmark written in {args.output}", file=sys.stderr)
+
+    errors = [r for r in bench["results"] if r["error"]]
+    for r in errors:
+        print(f"{r['days']} day(s) {r['stage']}: {r['error']}", file=sys.stderr)
+
+    if args.compare:
+        with open(args.compare) as f:
+            compare(bench, json.load(f))
+    return 1 if errors else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -4,13 +4,17 @@
 Script file name: RSKsomlit_plt.py
 Author: Etienne Poirier, IRD, Plouzané
 Date created: 2025-06-02
-Last update: 2026-01-08
+Last update: 2026-10-18
 Description: various plotting functions for RBR Maestro profile data 
 used in Somlit experiments
 """
 
 import pyrsktools as pyrsk
 import matplotlib.pyplot as plt
+from matplotlib.figure import Figure
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+import math
+import numpy as np
 import os
 
 # custom lib
@@ -295,3 +299,239 @@ def plot_up_down2(rsk_d, rsk_u, param, profile_nb, save_path=None):
     plt.show()
 
     return fig, axes
+
+# %% batch figure engine
+# one figure reused by plot_up_down_batch in the current process
+batch_figure = None
+
+
+def get_batch_figure():
+    """
+    Returns the figure reused by plot_up_down_batch in this process.
+    The figure is created with the object-oriented API and an Agg canvas, it
+    is never registered in pyplot so it is never shown and never leaks in
+    the pyplot figure manager.
+
+    Returns:
+        fig: matplotlib Figure.
+    """
+    global batch_figure
+    if batch_figure is None:
+        batch_figure = Figure()
+        FigureCanvasAgg(batch_figure)
+    return batch_figure
+
+
+def release_batch_figure():
+    """
+    Clears and drops the figure reused by plot_up_down_batch, to free its
+    memory at the end of a batch.
+    """
+    global batch_figure
+    if batch_figure is not None:
+        batch_figure.clear()
+        batch_figure = None
+
+
+def plot_up_down_batch(rsk_d, rsk_u, params, profile_nb, save_path=None,
+                       fig=None, ncols=3):
+    """
+    Headless batch version of plot_up_down2: all the channels of one day are
+    drawn as subplots of one figure, downcast and upcast on each subplot with
+    the same styling as plot_up_down2 (blue/red lines with circle markers,
+    dashed upcast, uncertainty bars). No pyplot state is used and nothing is
+    shown, the figure is cleared before and after use.
+
+    Args:
+        rsk_d: RSK object for downcast data.
+        rsk_u: RSK object for upcast data.
+        params (list): Parameter/channel names to plot, one subplot each.
+        profile_nb (int): Profile number to use.
+        save_path: place to save the plot, in a 'figures' subfolder as
+            up_down_all.png. Nothing is saved if None.
+        fig: Figure to draw in, default is the figure of get_batch_figure().
+        ncols (int): number of columns of subplots.
+
+    Returns:
+        filename (str): path of the png saved, None if save_path is None.
+    """
+    if fig is None:
+        fig = get_batch_figure()
+    fig.clear()
+
+    # rows of the profile for each cast, y is the sea pressure as in
+    # pyrsktools plotprofiles used by plot_up_down2
+    down = np.concatenate(
+        [np.asarray(i, dtype=int)
+         for i in rsk_d.getprofilesindices(profile_nb, "down")])
+    up = np.concatenate(
+        [np.asarray(i, dtype=int)
+         for i in rsk_u.getprofilesindices(profile_nb, "up")])
+    data_d = rsk_d.data[down]
+    data_u = rsk_u.data[up]
+
+    params = [p for p in params if p in rsk_d.channelNames and p in rsk_u.channelNames]
+    if not params:
+        return None
+
+    ncols = min(ncols, len(params))
+    nrows = math.ceil(len(params) / ncols)
+    fig.set_size_inches(6 * ncols, 5 * nrows)
+    axes = fig.subplots(nrows, ncols, squeeze=False).flatten()
+
+    for ax in axes[len(params):]:
+        ax.remove()
+
+    for ax, param in zip(axes, params):
+        draw_up_down(ax, param, data_d[param], data_d["sea_pressure"],
+                     data_u[param], data_u["sea_pressure"])
+
+    fig.tight_layout()
+
+    save_filename = None
+    if save_path:
+        # Create 'figures' folder if it doesn't exist
+        figures_dir = os.path.join(save_path, "figures")
+        os.makedirs(figures_dir, exist_ok=True)
+        save_filename = os.path.join(figures_dir, "up_down_all.png")
+        fig.savefig(save_filename, dpi=150, bbox_inches='tight')
+
+    # release the artists now, the figure itself is kept for the next call
+    fig.clear()
+
+    return save_filename
+
+
+def draw_up_down(ax, param, x_down, y_down, x_up, y_up):
+    """
+    Draws one channel downcast and upcast on an axes with the styling of
+    plot_up_down2, used by plot_up_down_batch and render_up_down_job.
+
+    Args:
+        ax: matplotlib Axes to draw in.
+        param (str): Parameter/channel name.
+        x_down, y_down: downcast values and sea pressure.
+        x_up, y_up: upcast values and sea pressure.
+
+    Returns:
+        None.
+    """
+    # Get uncertainty
+    try:
+        uncertainty = get_uncertainty(param)
+    except KeyError:
+        print(f"[WARNING] No uncertainty defined for '{
+              param}' — skipping error bars.")
+        uncertainty = None
+
+    # Style downcast line
+    ax.plot(x_down, y_down, color='blue', linestyle='-', linewidth=1.0,
+            marker='o', markerfacecolor='blue', markeredgecolor='black',
+            markersize=5, label="Downcast")
+    # Style upcast line
+    ax.plot(x_up, y_up, color='red', linestyle='--', linewidth=1.0,
+            marker='o', markerfacecolor='red', markeredgecolor='black',
+            markersize=5, label="Upcast")
+
+    # Add uncertainty bars if available
+    if uncertainty:
+        ax.errorbar(
+            x_down, y_down,
+            xerr=uncertainty,
+            fmt='none',
+            ecolor='blue',
+            alpha=0.4,
+            capsize=2,
+            elinewidth=0.7,
+            label='_nolegend_'
+        )
+        ax.errorbar(
+            x_up, y_up,
+            xerr=uncertainty,
+            fmt='none',
+            ecolor='red',
+            alpha=0.4,
+            capsize=2,
+            elinewidth=0.7,
+            label='_nolegend_'
+        )
+
+    ax.invert_yaxis()
+    ax.legend()
+    ax.set_title(param)
+    ax.set_xlabel(param)
+    ax.set_ylabel("Depth")
+    ax.grid(True)
+    ax.tick_params(axis="both", labelsize=8)
+
+
+# %% deferred figure jobs
+
+
+def up_down_figure_jobs(rsk_d, rsk_u, params, profile_nb, save_path):
+    """
+    Prepares the per-channel figures of one day as compact jobs that can be
+    sent to other processes: each job only holds the binned values and sea
+    pressure of one channel for the profile, not the RSK objects.
+
+    Args:
+        rsk_d: RSK object for downcast data.
+        rsk_u: RSK object for upcast data.
+        params (list): Parameter/channel names to plot, one job each.
+        profile_nb (int): Profile number to use.
+        save_path: place to save the plots, in a 'figures' subfolder.
+
+    Returns:
+        jobs (list): list of dictionnaries, cf. render_up_down_job.
+    """
+    down = np.concatenate(
+        [np.asarray(i, dtype=int)
+         for i in rsk_d.getprofilesindices(profile_nb, "down")])
+    up = np.concatenate(
+        [np.asarray(i, dtype=int)
+         for i in rsk_u.getprofilesindices(profile_nb, "up")])
+    data_d = rsk_d.data[down]
+    data_u = rsk_u.data[up]
+
+    jobs = []
+    for param in params:
+        if param not in rsk_d.channelNames or param not in rsk_u.channelNames:
+            continue
+        jobs.append({
+            "param": param,
+            # plain contiguous float arrays pickle compactly
+            "x_down": np.ascontiguousarray(data_d[param]),
+            "y_down": np.ascontiguousarray(data_d["sea_pressure"]),
+            "x_up": np.ascontiguousarray(data_u[param]),
+            "y_up": np.ascontiguousarray(data_u["sea_pressure"]),
+            "save_path": save_path,
+        })
+    return jobs
+
+
+def render_up_down_job(job):
+    """
+    Renders one job of up_down_figure_jobs in its own headless figure and
+    saves it as figures/<param>.png, like plot_up_down2. Meant to run in a
+    worker process, the figure is released before returning.
+
+    Args:
+        job (dict): job made by up_down_figure_jobs.
+
+    Returns:
+        filename (str): path of the png saved.
+    """
+    fig = Figure(figsize=(6, 5))
+    FigureCanvasAgg(fig)
+    ax = fig.add_subplot()
+    draw_up_down(ax, job["param"], job["x_down"], job["y_down"],
+                 job["x_up"], job["y_up"])
+    fig.tight_layout()
+
+    figures_dir = os.path.join(job["save_path"], "figures")
+    os.makedirs(figures_dir, exist_ok=True)
+    save_filename = os.path.join(figures_dir, f"{job['param']}.png")
+    fig.savefig(save_filename, dpi=150, bbox_inches='tight')
+    fig.clear()
+
+    return save_filename
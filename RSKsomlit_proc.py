@@ -4,35 +4,43 @@
 Script file name: RSKsomlit_proc.py
 Author: Etienne Poirier, IRD, Plouzané
 Date created: 2025-06-02
-Last update: 2026-01-08
+Last update: 2026-10-18
 Description: various processing functions for RBR Maestro profile data 
 used in Somlit experiments.
 Crucial function: procRSK that processes a RSK file and its channels
 """
-import pyrsktools as pyrsk
 import numpy as np
 import os
-import math
 import pandas as pd
 from datetime import datetime
 import glob
 from pathlib import Path
 from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+import copy
+import hashlib
+import json
 import re
+import time
+import tracemalloc
+import traceback
 
 # custom lib
 import sites
-import RSKsomlit_proc as rsksproc
-import RSKsomlit_plt as rsksplt
+# pyrsktools and RSKsomlit_plt (matplotlib) are imported in the functions
+# reading RSK files or plotting, so that headless uses such as toSomlitDB
+# do not pay their import time
 
 
 # %% Processing functions below
 # %% func export_profiles2rsk
-def export_profiles2rsk(inp_file, output_dir="."):
+def export_profiles2rsk(inp_file, output_dir=".", writers=4):
     """
     Takes one single RSK file with several profiles inside
     Split the RSK file into one RSK file per PROFILE region, preserving metadata
     Automatically deletes existing files with the same name when running the script
+    The data are read once and the profiles detected once, each profile is
+    a slice of the data (cf. cast_view) written by a pool of threads.
 
     Parameters
     ----------
@@ -41,6 +49,8 @@ def export_profiles2rsk(inp_file, output_dir="."):
     output_dir : str, optional
         Directory where the profile RSK files will be saved.
         Defaults to the directory up ".".
+    writers : int, optional
+        Number of profile files written at the same time. Defaults to 4.
     Returns:
     ----------
     outputs : List
@@ -50,8 +60,13 @@ def export_profiles2rsk(inp_file, output_dir="."):
     # base name without extension of rsk file
     base_name = os.path.splitext(os.path.basename(inp_file))[0]
 
+    import pyrsktools as pyrsk
+
     with pyrsk.RSK(inp_file) as rsk:  # metadata loaded
 
+        # all the data read once, the profiles are sliced from it
+        rsk.readdata()
+
         # Try to get RegionProfile class
         try:
             from pyrsktools.datatypes import RegionProfile
@@ -66,7 +81,6 @@ def export_profiles2rsk(inp_file, output_dir="."):
             ]
 
         if not profiles:
-            rsk.readdata()
             rsk.computeprofiles()
             profiles = [
                 reg
@@ -77,13 +91,23 @@ def export_profiles2rsk(inp_file, output_dir="."):
         if not profiles:
             raise RuntimeError("No PROFILE regions found in this file.")
 
-        outputs = []
+        # the data are sorted by time, the rows of a profile are found by
+        # dichotomy, t1 and t2 included as in readdata(t1, t2)
+        timestamps = rsk.data["timestamp"]
+        jobs = []
         for i, prof in enumerate(profiles):
             t1, t2 = prof.tstamp1, prof.tstamp2
+            rows = slice(
+                np.searchsorted(timestamps, t1, side="left"),
+                np.searchsorted(timestamps, t2, side="right"),
+            )
 
-            new = rsk.copy()
-            new.readdata(t1, t2)
-            new.computeprofiles()
+            # light copy of rsk, cf. cast_view, holding only the profile data
+            # and the regions of the profile
+            new = cast_view(rsk, rows=rows)
+            new.regions = [
+                reg for reg in rsk.regions if reg.tstamp1 >= t1 and reg.tstamp2 <= t2
+            ]
 
             # safe filename suffix
             t1s = np.datetime_as_string(t1, unit="s").replace(":", "-")
@@ -98,17 +122,93 @@ def export_profiles2rsk(inp_file, output_dir="."):
             if os.path.exists(outname):
                 os.remove(outname)
                 print("Deleted existing file:", outname)
+            jobs.append((new, f"profile_{i}_{t1s}_to_{t2s}", outname))
 
-            # export
-            new.RSK2RSK(
-                outputDir=output_dir, suffix=f"profile_{i}_{t1s}_to_{t2s}"
-            )
-            outputs.append(outname)
-            print("Wrote:", outname)
+        # export, the files are written by at most writers threads
+        outputs = []
+        with ThreadPoolExecutor(max_workers=max(1, writers)) as executor:
+            futures = [
+                executor.submit(new.RSK2RSK, outputDir=output_dir, suffix=suffix)
+                for new, suffix, _ in jobs
+            ]
+            for future, (_, _, outname) in zip(futures, jobs):
+                future.result()
+                outputs.append(outname)
+                print("Wrote:", outname)
 
     return outputs
 
 
+# %% score_profiles
+
+
+def score_profiles(sea_pressure, castIndices):
+    """
+    Scores every cast given by rsk.getprofilesindices() in one NumPy pass.
+    For each cast, the first and last non-nan sea pressure are found and the
+    pressure span (last - first) is computed. The best cast is the one with
+    the highest span, the first one being kept in case of equality, as in
+    the former loop of find_profile
+
+    Parameters
+    ----------
+    sea_pressure : numpy array
+        sea_pressure channel of the rsk data, ie. rsk.data["sea_pressure"]
+    castIndices : List
+        list of lists of indices, one list per cast, as given by
+        rsk.getprofilesindices()
+
+    Returns
+    -------
+    profile : int
+        the cast number with the highest pressure difference
+    scores : DataFrame
+        score table with one row per cast: profile, first_pressure,
+        last_pressure and delta_p. Casts with no valid pressure get nan
+
+    """
+    n_casts = len(castIndices)
+    lengths = np.fromiter((len(i) for i in castIndices), dtype=np.intp, count=n_casts)
+
+    first_p = np.full(n_casts, np.nan)
+    last_p = np.full(n_casts, np.nan)
+
+    if lengths.sum() > 0:
+        # all the indices of all the casts in one flat array, with the cast
+        # number of each indice alongside
+        flat = np.concatenate([np.asarray(i, dtype=np.intp) for i in castIndices])
+        cast_id = np.repeat(np.arange(n_casts), lengths)
+
+        pressure = np.asarray(sea_pressure)[flat]
+        valid = ~np.isnan(pressure)
+        valid_cast = cast_id[valid]
+        valid_p = pressure[valid]
+
+        # cast_id is sorted so the first occurence of each cast in the valid
+        # samples is its first non-nan value, and reversed its last one
+        casts, first = np.unique(valid_cast, return_index=True)
+        _, last = np.unique(valid_cast[::-1], return_index=True)
+        first_p[casts] = valid_p[first]
+        last_p[casts] = valid_p[::-1][last]
+
+    deltap = last_p - first_p
+
+    scores = pd.DataFrame(
+        {
+            "profile": np.arange(n_casts),
+            "first_pressure": first_p,
+            "last_pressure": last_p,
+            "delta_p": deltap,
+        }
+    )
+
+    # nanargmax skips the nan differences and raises ValueError when there is
+    # no valid cast at all, like max() on an empty list did
+    profile = int(np.nanargmax(deltap))
+
+    return profile, scores
+
+
 # %% find_profile
 
 
@@ -128,41 +228,969 @@ def find_profile(rsk):
     profile: int
         the profile number with highest depth difference
     """
-    # empty list to be filled with [profile number, max pressure difference] by the program
-    liste = []
     # function below gives list with lists inside with all the indices for each down cast
     downcastIndices = rsk.getprofilesindices(direction="down")
-    # d number of down cast in rsk file
-    for d in range(len(downcastIndices)):
-        # i is the list of indices in the array for down cast d
-        i = downcastIndices[d]
-        # for pofile d, compare max depth (last indice) - min depth(first indice)
-        # we must check for nan values in sea-pressure first
-        # we run on indices in list i to find the first one that is not 'nan'
-        for n in i:
-            if np.isnan(rsk.data[n]["sea_pressure"]):
-                continue
-            break
-        # we run again on indices but starting from the end to go faster and find the last indice of the profile
-        # that is not 'nana
-        for k in list(reversed(i)):
-            if np.isnan(rsk.data[k]["sea_pressure"]):
-                continue
-            break
-        # we calculate the pressure difference between the end and the beginning of the downcast
-        deltap = rsk.data[k]["sea_pressure"] - rsk.data[n]["sea_pressure"]
-        # a problem we have is that we get a 'nan' in the pressure difference with the line below
-        liste.append([d, deltap])
+
     # we look for the biggest downcast in terms of pressure difference
-    # Filter out entries with NaN, to be remove in new version of code
-    filtered = [pair for pair in liste if not math.isnan(pair[1])]
+    profile, scores = score_profiles(rsk.data["sea_pressure"], downcastIndices)
 
-    # Find the pair with the max b value
-    max_pair = max(filtered, key=lambda x: x[1])
+    return profile
 
-    profile = max_pair[0]
 
-    return profile
+# %% select_profiles
+
+# smallest downcast pressure span (dbar) of a valid profile in the multi-profile
+# mode, the swell false casts at the surface stay well below
+PROFILE_MIN_SPAN = 2.0
+
+
+def select_profiles(rsk, profiles="best", min_span=PROFILE_MIN_SPAN):
+    """
+    Selects the profiles of the rsk file to process.
+    "best" keeps the deepest downcast only, cf. find_profile.
+    "all" keeps every valid profile, ie. every downcast whose sea pressure
+    span reaches min_span, to process a file with several SOMLIT profiles
+    (repeated casts, several stations on the same day). The deepest cast is
+    kept if none reaches min_span
+
+    Parameters
+    ----------
+    rsk : RSK object
+        rsk data before binning but after computation of the profiles
+    profiles : str, optional
+        "best" or "all". The default is "best".
+    min_span : float, optional
+        smallest sea pressure span (dbar) of a valid downcast with "all".
+        The default is PROFILE_MIN_SPAN.
+
+    Returns
+    -------
+    profile_nb : int or List
+        the profile number with "best", the sorted list of the valid
+        profile numbers with "all"
+
+    """
+    if profiles == "best":
+        return find_profile(rsk)
+    if profiles != "all":
+        raise ValueError(f"profiles must be 'best' or 'all', not {profiles!r}")
+
+    downcastIndices = rsk.getprofilesindices(direction="down")
+    best, scores = score_profiles(rsk.data["sea_pressure"], downcastIndices)
+    valid = scores.loc[scores["delta_p"] >= min_span, "profile"].tolist()
+
+    return valid or [best]
+
+
+# %% day_fingerprint
+
+
+def day_fingerprint(data, chunk_size=1_000_000):
+    """
+    Computes a cheap fingerprint of a block of rsk data to detect identical
+    days without writing or comparing the rsk files.
+    The fingerprint is the number of samples, the first and last timestamps
+    and a hash of every channel array, fed chunk by chunk to avoid copying
+    the whole data
+
+    Parameters
+    ----------
+    data : numpy structured array
+        rsk data of one day, ie. rsk.data[index]
+    chunk_size : int, optional
+        number of samples hashed at a time. The default is 1_000_000.
+
+    Returns
+    -------
+    tuple
+        (number of samples, first timestamp, last timestamp, hash)
+
+    """
+    n = len(data)
+    if n == 0:
+        return (0, None, None, None)
+
+    h = hashlib.blake2b(digest_size=16)
+    # channel names and types are part of the content
+    h.update(str(data.dtype.descr).encode())
+    for name in data.dtype.names:
+        channel = data[name]
+        for start in range(0, n, chunk_size):
+            h.update(np.ascontiguousarray(channel[start:start + chunk_size]).tobytes())
+
+    return (n, data["timestamp"][0], data["timestamp"][-1], h.hexdigest())
+
+
+# %% ScanSession
+
+
+class ScanSession:
+    """
+    State of one scan_rsk run over the raw rsk files.
+    The raw files are never held whole: their days are found without
+    reading the data (rsk_day_inventory) and a multi-day file is read day by
+    day (iter_days), so that the memory is bounded by one day on long
+    deployments. Only a single-day file is read whole, once, to be written.
+    The session keeps the fingerprints of the days already written so that a
+    day found identical in another raw file is never written nor processed.
+    """
+
+    def __init__(self):
+        self.fingerprints = defaultdict(set)  # YYYYMMDD -> fingerprints written
+        self.skipped = defaultdict(list)  # YYYYMMDD -> day files not written
+
+    def iter_days(self, rsk_file, window=None):
+        """
+        Yields the data of rsk_file day by day, read window by window so
+        that only one day is held at a time, cf. iter_rsk_days
+
+        Parameters
+        ----------
+        rsk_file : str
+            Path to the rsk file
+        window : numpy timedelta64, optional
+            time window of each read. The default is None, READ_WINDOW.
+
+        Yields
+        ------
+        rsk : RSK object
+            RSK object of the file, for its metadata
+        day : numpy datetime64[D]
+            day of the data
+        data : numpy structured array
+            rsk data of the day
+
+        """
+        import pyrsktools as pyrsk
+
+        with pyrsk.RSK(rsk_file) as rsk:
+            if window is None:
+                window = READ_WINDOW
+            for day, data in iter_rsk_days(rsk, window):
+                yield rsk, day, data
+
+    def is_duplicate_day(self, output_file, day_str, data):
+        """
+        Checks if the data of one day are identical to a day already written
+        during this session. The first time a day content is seen it is
+        registered, the next times the output file is recorded as skipped
+
+        Parameters
+        ----------
+        output_file : str
+            Path of the _YYYYMMDD.rsk file that would be written
+        day_str : str
+            day in the YYYYMMDD format
+        data : numpy structured array
+            rsk data of the day
+
+        Returns
+        -------
+        bool
+            True if identical data have already been written for this day
+
+        """
+        fingerprint = day_fingerprint(data)
+        if fingerprint in self.fingerprints[day_str]:
+            self.skipped[day_str].append(output_file)
+            print(f"⚠️ Identical data for date {day_str}, not writing: {
+                os.path.basename(output_file)}")
+            return True
+        self.fingerprints[day_str].add(fingerprint)
+        return False
+
+
+# %% StageProfiler
+
+
+class StageProfiler:
+    '''
+    Opt-in profiling of the processing stages of a file. Each call to
+    lap(name) closes the stage started at the previous lap (or at the
+    creation) and records its wall time, CPU time and peak allocation.
+    The allocations are traced with tracemalloc while the profiler is
+    running, which slows the processing down, so it is only used when
+    asked, cf. process_rsk_file(profile=True)
+
+    usage example:
+        profiler = StageProfiler("file.rsk")
+        rsk.readdata()
+        profiler.lap("readdata")
+        ...
+        profiler.stop()
+        profiler.save(folder)
+
+    '''
+
+    def __init__(self, source):
+        self.source = source
+        self.stages = []
+        # tracemalloc may already be running, e.g. in the benchmark
+        self._own_tracing = not tracemalloc.is_tracing()
+        if self._own_tracing:
+            tracemalloc.start()
+        self._start()
+
+    def _start(self):
+        self._wall = time.perf_counter()
+        self._cpu = time.process_time()
+        self._current = tracemalloc.get_traced_memory()[0]
+        tracemalloc.reset_peak()
+
+    def lap(self, name):
+        '''
+        Records the stage name, from the previous lap to now
+
+        Parameters
+        ----------
+        name : str
+            name of the stage
+
+        Returns
+        -------
+        None.
+
+        '''
+        current, peak = tracemalloc.get_traced_memory()
+        self.stages.append(
+            {
+                "stage": name,
+                "wall_s": round(time.perf_counter() - self._wall, 4),
+                "cpu_s": round(time.process_time() - self._cpu, 4),
+                # allocated on top of what was there at the stage start
+                "peak_alloc_mb": round((peak - self._current) / 2**20, 2),
+            }
+        )
+        self._start()
+
+    def stop(self):
+        if self._own_tracing and tracemalloc.is_tracing():
+            tracemalloc.stop()
+
+    def report(self):
+        '''
+        Returns
+        -------
+        Dictionnary
+            source file, stages and totals, cf. PROFILE_NAME
+
+        '''
+        return {
+            "source": self.source,
+            "stages": self.stages,
+            "total_wall_s": round(sum(s["wall_s"] for s in self.stages), 4),
+            "total_cpu_s": round(sum(s["cpu_s"] for s in self.stages), 4),
+            "peak_alloc_mb": max((s["peak_alloc_mb"] for s in self.stages), default=0),
+        }
+
+    def save(self, folder):
+        '''
+        Writes the report in folder as PROFILE_NAME
+
+        Returns
+        -------
+        str
+            path of the report
+
+        '''
+        path = os.path.join(folder, PROFILE_NAME)
+        with open(path, "w") as f:
+            json.dump(self.report(), f, indent=2)
+        return path
+
+
+# name of the stage profiling report in the output folder of a file
+PROFILE_NAME = "profile.json"
+
+
+def summarize_profiles(reports):
+    '''
+    Summary of several StageProfiler reports, one row per stage in the
+    order of the processing
+
+    Parameters
+    ----------
+    reports : List
+        reports of StageProfiler.report or read from PROFILE_NAME files
+
+    Returns
+    -------
+    DataFrame
+        stage, files, total and mean wall time, total CPU time and max
+        peak allocation of each stage, sorted by total wall time
+
+    '''
+    rows = [dict(st, source=r["source"]) for r in reports for st in r["stages"]]
+    if not rows:
+        return pd.DataFrame(
+            columns=["stage", "files", "wall_s", "mean_wall_s", "cpu_s", "peak_alloc_mb"]
+        )
+    df = pd.DataFrame(rows)
+    summary = df.groupby("stage", sort=False).agg(
+        files=("source", "nunique"),
+        wall_s=("wall_s", "sum"),
+        mean_wall_s=("wall_s", "mean"),
+        cpu_s=("cpu_s", "sum"),
+        peak_alloc_mb=("peak_alloc_mb", "max"),
+    )
+    summary["share"] = (summary["wall_s"] / summary["wall_s"].sum()).round(3)
+    return summary.sort_values("wall_s", ascending=False).reset_index().round(4)
+
+
+# %% DO compensation
+
+
+def do_subsampling_stride(timestamps, period=1.0):
+    '''
+    Stride to sub-sample the DO channels at about one value per period,
+    from the sample period of the data: 8 at 8Hz, 2 at 2Hz for 1 s
+
+    Parameters
+    ----------
+    timestamps : numpy datetime64 array
+        timestamps of the samples
+    period : float, optional
+        period wanted between the DO samples (s). The default is 1.0.
+
+    Returns
+    -------
+    int
+        sub-sampling stride, at least 1
+
+    '''
+    if len(timestamps) < 2:
+        return 1
+    # median, robust to the gaps of the file
+    sample_period = np.median(
+        np.diff(timestamps.astype("datetime64[ms]").view(np.int64))
+    ) / 1000
+    if not sample_period > 0:
+        return 1
+    return max(1, int(round(period / sample_period)))
+
+
+def interp_pair(x, xp, fp1, fp2):
+    '''
+    np.interp of two series sharing the same abscissa in one pass: the
+    positions of x in xp are searched once. Same formula and edge cases as
+    np.interp so that the values are identical
+
+    Parameters
+    ----------
+    x : numpy array
+        abscissa to interpolate at
+    xp : numpy array
+        increasing abscissa of the data
+    fp1, fp2 : numpy array
+        the two series, same length as xp
+
+    Returns
+    -------
+    Tuple of two numpy arrays
+        fp1 and fp2 interpolated at x
+
+    '''
+    n = len(xp)
+    j = np.searchsorted(xp, x, side="right") - 1
+    # the last point and beyond take the last value, before the first the first
+    last = j >= n - 1
+    first = j < 0
+    jj = np.clip(j, 0, max(n - 2, 0))
+    inside = ~(last | first)
+    exact = inside & (xp[jj] == x)
+    dx = xp[jj + 1] - xp[jj] if n > 1 else np.ones_like(x)
+    x_j = x - xp[jj]
+    x_j1 = x - xp[jj + 1] if n > 1 else x_j
+
+    out = []
+    for fp in (fp1, fp2):
+        if n > 1:
+            slope = (fp[jj + 1] - fp[jj]) / dx
+            res = slope * x_j + fp[jj]
+            # if we get nan in one direction, try the other, as np.interp
+            nan = inside & np.isnan(res)
+            if nan.any():
+                res[nan] = slope[nan] * x_j1[nan] + fp[jj + 1][nan]
+                still = nan & np.isnan(res) & (fp[jj] == fp[jj + 1])
+                res[still] = fp[jj][still]
+        else:
+            res = np.empty_like(x)
+        res[exact] = fp[jj][exact]
+        res[first] = fp[0]
+        res[last] = fp[-1]
+        res[np.isnan(x)] = np.nan
+        out.append(res)
+    return out[0], out[1]
+
+
+def compensate_do(timestamps, sea_pressure, salinity, temperature, doxy, doxy_temp,
+                  patm, stride=None, offset=0.472, out=None):
+    '''
+    Compensation of the DO values from M.Dever ODO_EcoCTD script (jan.2026):
+    the DO and its temperature (temperature1, the temp logger of the DO
+    sensor) are sub-sampled at 1Hz, the DO is compensated for pressure and
+    salinity, then both are shifted in time to align with the CTD
+    measurements (vertical alignment).
+    Only the sub-sampled rows are computed, in small buffers, the other rows
+    are NaN in the outputs as before.
+
+    Parameters
+    ----------
+    timestamps : numpy datetime64 array
+        timestamps of the samples
+    sea_pressure, salinity, temperature : numpy array
+        CTD channels
+    doxy : numpy array
+        dissolved_o2_concentration channel
+    doxy_temp : numpy array
+        temperature1 channel
+    patm : float
+        atmospheric pressure (dBar)
+    stride : int, optional
+        sub-sampling stride, the default is None, 1Hz from the sample
+        period, cf. do_subsampling_stride
+    offset : float, optional
+        distance between CTD and optode [m]. The default is 0.472.
+    out : tuple of two numpy arrays, optional
+        preallocated buffers for the results, the default is None
+
+    Returns
+    -------
+    DOXY : numpy array
+        compensated DO, dissolved_o2_compensated
+    DOXY_TEMP : numpy array
+        aligned DO temperature, temperature1_compensated
+
+    '''
+    n = len(doxy)
+    if stride is None:
+        stride = do_subsampling_stride(timestamps)
+    if out is None:
+        out = (np.empty_like(doxy), np.empty_like(doxy_temp))
+    DOXY, DOXY_TEMP = out
+    DOXY.fill(np.nan)
+    DOXY_TEMP.fill(np.nan)
+
+    # SUB-SAMPLING DO and temperature data, e.g. from 8Hz at 1Hz
+    idx = np.arange(0, n, stride)
+    d = doxy[idx]
+    DOXY_TEMP[idx] = doxy_temp[idx]
+
+    # Pressure compensation of DOXY data (if needed)
+    # Fcp = 1 + c0 * (sea_pressure - patm), evaluated in place
+    c0 = 3.2e-5
+    f = sea_pressure[idx]
+    f -= patm
+    f *= c0
+    f += 1
+    d *= f
+
+    # Salinity compensation (if needed)
+    # Fcs = exp(S * (B0 + B1*Ts + B2*Ts**2 + B3*Ts**3) - C0 * S**2)
+    S = salinity[idx]
+    T = temperature[idx]
+    Ts = 298.15 - T
+    T += 273.15
+    Ts /= T
+    np.log(Ts, out=Ts)
+    np.multiply(6.93498e-3, Ts, out=f)
+    np.subtract(-6.24097e-3, f, out=f)
+    np.square(Ts, out=T)
+    T *= 6.90358e-3
+    f -= T
+    np.power(Ts, 3, out=T)
+    T *= 4.29155e-3
+    f -= T
+    f *= S
+    np.square(S, out=T)
+    T *= 3.11680e-7
+    f -= T
+    np.exp(f, out=f)
+    d *= f
+
+    # Vertical alignment of DO measure
+    # numeric seconds of the sub-sampled rows and of the rows before them
+    t0 = timestamps[0]
+    time_sec = (timestamps[idx] - t0) / np.timedelta64(1, "s")
+    # dp_dt is the vertical profiling speed, from the row before each
+    # sub-sampled row, 0 on the first row
+    prev = idx[1:] - 1
+    dp_dt = np.zeros(idx.size)
+    np.subtract(sea_pressure[idx[1:]], sea_pressure[prev], out=dp_dt[1:])
+    dp_dt[1:] /= time_sec[1:] - (timestamps[prev] - t0) / np.timedelta64(1, "s")
+    # set of a min speed 0.1
+    dp_dt[dp_dt < 0.1] = 0.1
+
+    # compute advective lag [in s]; that is the time it takes for a water parcel to
+    # travel the "offset" distance, given the profiling speed "dpdt"
+    np.divide(offset, dp_dt, out=dp_dt)
+
+    mask = ~np.isnan(d)  # boolean showing true for nonNan values only
+
+    # a shift of DOXY and temperature1 time is done to align with CTD
+    # measurements, both at once
+    xp = time_sec[mask]
+    DOXY[idx[mask]], DOXY_TEMP[idx[mask]] = interp_pair(
+        xp + dp_dt[mask], xp, d[mask], DOXY_TEMP[idx[mask]]
+    )
+    return DOXY, DOXY_TEMP
+
+
+# %% cast views
+
+
+def cast_view(rsk, data=None, rows=None):
+    '''
+    Light copy of rsk for a cast or a profile, instead of rsk.copy() that
+    duplicates all the data and opens the file again.
+    The metadata and the file connection are shared with rsk. The channels,
+    regions and logs are own lists, for the pyrsktools methods that change
+    them (addchannel, computeprofiles, appendlog, ...), which also replace
+    the data array rather than writing in it.
+
+    Parameters
+    ----------
+    rsk : RSK object
+        parent RSK
+    data : numpy structured array, optional
+        data of the view, e.g. the binned data of a cast. The default is
+        None, the rows of rsk.data.
+    rows : slice, optional
+        index range of the rows of rsk.data, used without data. The default
+        is None, all the rows.
+
+    Returns
+    -------
+    view : RSK object
+        light copy of rsk. Without data given, its data is a read-only view
+        of the rows of rsk.data: views are read-only by design, a write
+        raises ValueError instead of changing rsk. Give data, e.g.
+        rsk.data[rows].copy(), for a view to write in
+
+    '''
+    from pyrsktools.datatypes import DataArrayList
+
+    view = copy.copy(rsk)
+    view.channels = list(rsk.channels)
+    view.regions = list(rsk.regions)
+    view.logs = dict(rsk.logs)
+    view.dataArrays = DataArrayList(view.schedules)
+    if data is None and len(rsk.dataArrays):
+        data = rsk.data[rows if rows is not None else slice(None)]
+        data.flags.writeable = False
+    if data is not None:
+        view.data = data
+    return view
+
+
+# %% channel projection
+# channels each derived channel of procRSK is computed from
+CHANNEL_SOURCES = {
+    "sea_pressure": ["pressure"],
+    "depth": ["sea_pressure"],
+    "velocity": ["depth"],
+    "salinity": ["conductivity", "temperature", "sea_pressure"],
+    "density_anomaly": ["salinity", "temperature", "sea_pressure"],
+    "dissolved_o2_compensated": ["dissolved_o2_concentration", "temperature1",
+                                 "salinity", "temperature", "sea_pressure"],
+    "temperature1_compensated": ["temperature1", "dissolved_o2_compensated"],
+}
+# channels procRSK makes whatever the channels kept: profile detection,
+# loops removal, trim and DO compensation
+PROCESSING_CHANNELS = ["conductivity", "sea_pressure", "depth", "velocity",
+                       "salinity", "density_anomaly", "dissolved_o2_compensated",
+                       "temperature1_compensated"]
+
+
+def channel_closure(param):
+    '''
+    Channels procRSK needs to make the channels of param: param, the
+    processing channels and, recursively, the channels they are derived from
+
+    Parameters
+    ----------
+    param : List
+        channels kept in the outputs
+
+    Returns
+    -------
+    needed : set
+        names of the channels needed, measured and derived
+
+    '''
+    needed = set()
+    todo = list(param) + PROCESSING_CHANNELS
+    while todo:
+        name = todo.pop()
+        if name not in needed:
+            needed.add(name)
+            todo += CHANNEL_SOURCES.get(name, [])
+    return needed
+
+
+def project_channels(rsk, param):
+    '''
+    Keeps in rsk.channels only the channels of the file in the closure of
+    param (cf. channel_closure), so that readdata reads, and the processing
+    carries, only these columns. To call before readdata.
+
+    Parameters
+    ----------
+    rsk : RSK object
+        opened RSK, data not read
+    param : List
+        channels kept in the outputs
+
+    Returns
+    -------
+    dropped : List
+        names of the channels of the file not read
+
+    '''
+    needed = channel_closure(param)
+    dropped = [ch.longName for ch in rsk.channels if ch.longName not in needed]
+    rsk.channels = [ch for ch in rsk.channels if ch.longName in needed]
+    return dropped
+
+
+# %% bin averaging
+# fields of the RSK data (version >= 3.0.0) that are not channels
+META_FIELDS = ("id", "datasetId", "scheduleId", "sampleIndex")
+
+
+def depth_bins(boundary, bin_size, direction):
+    '''
+    Edges and centres of the bins of RSK.binaverage for one boundary pair:
+    bins of bin_size laid from the boundary in the direction of the cast,
+    then sorted ascending for both casts.
+
+    Parameters
+    ----------
+    boundary : list
+        the two limits of the binning
+    bin_size : float
+        size of the bins
+    direction : str
+        "down" or "up"
+
+    Returns
+    -------
+    edges : numpy array
+        ascending edges, a sample y is in bin j when edges[j] <= y < edges[j+1]
+    centres : numpy array
+        centres of the bins, the binBy value of the binned rows
+
+    '''
+    low, high = sorted(boundary)
+    if direction == "up":
+        edges = np.arange(high, low, -bin_size)
+        edges = np.append(edges, edges[-1] - bin_size)
+    else:
+        edges = np.arange(low, high, bin_size)
+        edges = np.append(edges, edges[-1] + bin_size)
+    edges = np.unique(edges)
+    # 2 points moving average, as pyrsktools lagave
+    centres = 0.5 * edges[1:] + 0.5 * edges[:-1]
+    return edges, centres
+
+
+def binaverage_profile(values, y, timestamps, edges):
+    '''
+    Bin averages all the channels of one cast at once: the bin of each
+    sample is found once, then the sums and counts of the non NaN values of
+    every channel and bin are made by a single bincount.
+    The sums are made in the order of the samples, as np.nanmean does, so
+    the averages are the ones of RSK.binaverage.
+
+    Parameters
+    ----------
+    values : numpy array
+        samples x channels values of the cast
+    y : numpy array
+        binBy values of the samples
+    timestamps : numpy array
+        timestamps of the samples in ms (int64)
+    edges : numpy array
+        ascending bin edges, cf. depth_bins
+
+    Returns
+    -------
+    binned : numpy array
+        bins x channels averages, NaN when a bin has no value
+    binned_timestamps : numpy array
+        mean timestamp in ms of the samples of each bin, the first
+        timestamp of the cast for the empty bins
+    counts : numpy array
+        number of samples in each bin
+
+    '''
+    nbins = edges.size - 1
+    nchannels = values.shape[1]
+    # lower <= y < upper, NaN goes beyond the last bin
+    bins = np.searchsorted(edges, y, side="right") - 1
+    inbin = (bins >= 0) & (bins < nbins)
+    bins = bins[inbin]
+    values = values[inbin]
+    counts = np.bincount(bins, minlength=nbins)
+
+    keys = (bins[:, None] * nchannels + np.arange(nchannels)).ravel()
+    isvalue = ~np.isnan(values)
+    sums = np.bincount(keys, weights=np.where(isvalue, values, 0).ravel(),
+                       minlength=nbins * nchannels)
+    nvalues = np.bincount(keys, weights=isvalue.ravel(), minlength=nbins * nchannels)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        binned = (sums / nvalues).reshape(nbins, nchannels)
+
+    # mean timestamps truncated to the ms as np.mean of timedelta64, from
+    # the first timestamp of the cast to keep the sums exact in float
+    t0 = timestamps[0]
+    first = timestamps.min()
+    offsets = np.bincount(bins, weights=timestamps[inbin] - first, minlength=nbins)
+    binned_timestamps = np.full(nbins, t0, dtype=np.int64)
+    full = counts > 0
+    binned_timestamps[full] = first + np.rint(offsets[full]).astype(np.int64) // counts[full]
+    return binned, binned_timestamps, counts
+
+
+def binaverage_casts(rsk, profiles, bin_size, boundaries, bin_by="depth"):
+    '''
+    Bin averages of the down and up casts of rsk, numpy version of
+    RSK.binaverage(profiles, binBy, binSize, boundary, direction) giving the
+    same rows: one row per bin and profile, binBy set to the centre of the
+    bin, NaN values and the first timestamp of the cast for the empty bins.
+    Only the rows of the casts are made into a samples x channels array.
+
+    Parameters
+    ----------
+    rsk : RSK object
+        processed data, with the profiles
+    profiles : int or list
+        profiles to bin
+    bin_size : float
+        size of the bins
+    boundaries : dict
+        boundary of the binning of each direction, e.g.
+        {"down": [0.625, 9.75], "up": [0.75, 10.625]}
+    bin_by : str, optional
+        channel to bin by. The default is "depth".
+
+    Returns
+    -------
+    binned : dict
+        for each direction of boundaries, the binned data with the dtype
+        of rsk.data and the log entry of RSK.binaverage
+
+    '''
+    import numpy.lib.recfunctions as rfn
+
+    data = rsk.data
+    fields = [f for f in data.dtype.names if f != "timestamp" and f not in META_FIELDS]
+    channels = data[fields]
+    col = fields.index(bin_by)
+    timestamps = data["timestamp"].astype("datetime64[ms]").view(np.int64)
+    unit = [ch.units for ch in rsk.channels if ch.longName == bin_by][0]
+
+    binned = {}
+    for direction, boundary in boundaries.items():
+        edges, centres = depth_bins(boundary, bin_size, direction)
+        nbins = centres.size
+        indices = rsk.getprofilesindices(profiles, direction)
+        out = np.empty(len(indices) * nbins, dtype=data.dtype)
+        for i, cast in enumerate(indices):
+            cast = np.asarray(cast)
+            rows = slice(i * nbins, (i + 1) * nbins)
+            values = rfn.structured_to_unstructured(channels[cast])
+            cast_values, cast_timestamps, _ = binaverage_profile(
+                values, values[:, col], timestamps[cast], edges
+            )
+            cast_values[:, col] = centres
+            out["timestamp"][rows] = cast_timestamps.astype("datetime64[ms]")
+            for j, field in enumerate(fields):
+                out[field][rows] = cast_values[:, j]
+        # numbered from 1 as RSK.binaverage does
+        for field, value in zip(META_FIELDS, (None, 1, 1, None)):
+            if field in data.dtype.names:
+                out[field] = np.arange(1, out.size + 1) if value is None else value
+
+        # same log as RSK.binaverage, boundaries in the order of the cast
+        logged = np.sort(np.asarray(boundary, dtype="float64"))
+        if direction == "up":
+            logged = logged[::-1]
+        log = (f"Binned with respect to {bin_by} using {logged} boundaries"
+               f" with {np.array([bin_size], dtype='float64')} {unit} bin size.")
+        binned[direction] = (out, log)
+    return binned
+
+
+# %% partition_by_day
+
+
+def partition_by_day(timestamps):
+    """
+    Partitions a timestamp array into days.
+    The whole array is cast to days in one operation and the day boundaries
+    are found with searchsorted, so each day is returned as a slice that
+    gives a view (no copy) of the data. Rsk data are sorted in time, if not
+    the days are returned as arrays of indices instead of slices
+
+    Parameters
+    ----------
+    timestamps : numpy array
+        datetime64 array of the samples, ie. rsk.data["timestamp"]
+
+    Returns
+    -------
+    days : List
+        List of (day, index) tuples sorted by day, day is a numpy
+        datetime64[D] and index a slice or an array of indices to use on the
+        rsk data, eg. rsk.data[index]
+
+    """
+    dates = np.asarray(timestamps).astype("datetime64[D]")
+    if dates.size == 0:
+        return []
+
+    if np.all(dates[1:] >= dates[:-1]):
+        # sorted: each day is a contiguous block of samples
+        order = None
+        sorted_dates = dates
+    else:
+        # stable sort keeps the original order of the samples within a day
+        order = np.argsort(dates, kind="stable")
+        sorted_dates = dates[order]
+
+    unique_days = np.unique(sorted_dates)
+    starts = np.searchsorted(sorted_dates, unique_days, side="left")
+    stops = np.searchsorted(sorted_dates, unique_days, side="right")
+
+    days = []
+    for day, start, stop in zip(unique_days, starts, stops):
+        if order is None:
+            days.append((day, slice(int(start), int(stop))))
+        else:
+            days.append((day, order[start:stop]))
+
+    return days
+
+
+# %% iter_rsk_days
+# time window of each readdata of iter_rsk_days
+READ_WINDOW = np.timedelta64(6, "h")
+
+
+def iter_rsk_days(rsk, window=READ_WINDOW):
+    """
+    Reads an opened rsk file window by window with readdata(t1, t2), over
+    its epoch as readdata() does, and yields the data of each day as soon as
+    the day is read. The windows never cross midnight, so the memory used is
+    one day plus one window whatever the length of the deployment, e.g.
+    months of pause between the SOMLIT days.
+    rsk.data holds the last window read afterwards.
+
+    Parameters
+    ----------
+    rsk : RSK object
+        opened RSK, its data are not needed
+    window : numpy timedelta64, optional
+        time window of each read. The default is READ_WINDOW, 6 hours.
+
+    Yields
+    ------
+    day : numpy datetime64[D]
+        day of the data
+    data : numpy structured array
+        rsk data of the day, in time order
+
+    """
+    ms = np.timedelta64(1, "ms")
+    start = rsk.epoch.startTime if rsk.epoch else None
+    end = rsk.epoch.endTime if rsk.epoch else None
+    if start is None or end is None or np.isnat(start) or np.isnat(end):
+        # no epoch, the whole table is read by readdata()
+        rsk.readdata()
+        for day, index in partition_by_day(rsk.data["timestamp"]):
+            yield day, rsk.data[index]
+        return
+
+    start = start.astype("datetime64[ms]")
+    end = end.astype("datetime64[ms]")
+    day, chunks = None, []
+    t1 = start
+    while t1 <= end:
+        if chunks and t1.astype("datetime64[D]") != day:
+            yield day, chunks[0] if len(chunks) == 1 else np.concatenate(chunks)
+            chunks = []
+        day = t1.astype("datetime64[D]")
+        # t1 and t2 included, the window stops before midnight
+        t2 = min(t1 + window, (day + 1).astype("datetime64[ms]"), end + ms) - ms
+        # readdata needs t2 > t1, the rows before t1 are dropped below
+        rsk.readdata(min(t1, t2 - ms), t2)
+        data = rsk.data
+        data = data[np.searchsorted(data["timestamp"], t1):]
+        if len(data):
+            chunks.append(data)
+        t1 = t2 + ms
+    if chunks:
+        yield day, chunks[0] if len(chunks) == 1 else np.concatenate(chunks)
+
+
+# %% rsk_day_inventory
+
+
+def rsk_day_inventory(rsk_file):
+    """
+    Days of a rsk file from one aggregate query on the timestamp column of
+    its data table (an RSK file is a SQLite database), without reading the
+    channels. The samples counted are the ones readdata() reads: within the
+    epoch of the file, first schedule only.
+
+    Parameters
+    ----------
+    rsk_file : str
+        Path to the rsk file
+
+    Returns
+    -------
+    inventory : pandas DataFrame
+        one row per day in time order: day, samples (number of samples),
+        first and last (first and last timestamps of the day)
+
+    """
+    import sqlite3
+    import pyrsktools as pyrsk
+
+    # epoch as read by pyrsktools, whatever the version of the file
+    with pyrsk.RSK(rsk_file) as rsk:
+        epoch = rsk.epoch
+
+    db = sqlite3.connect(f"file:{os.path.abspath(rsk_file)}?mode=ro", uri=True)
+    try:
+        columns = [row[1] for row in db.execute("PRAGMA table_info(data)")]
+        # tstamp before v3.0.0 of the RSK format, timestamp after
+        tstamp = "tstamp" if "tstamp" in columns else "timestamp"
+        where, args = [], []
+        bounds = (epoch.startTime, epoch.endTime) if epoch is not None else (None, None)
+        if not any(t is None or np.isnat(t) for t in bounds):
+            where.append(f"{tstamp} BETWEEN ? AND ?")
+            args += [int(t.astype("datetime64[ms]").astype(np.int64)) for t in bounds]
+        if "scheduleId" in columns:
+            where.append("scheduleId = 1")
+        rows = db.execute(
+            f"SELECT {tstamp} / 86400000 AS day, COUNT(*), MIN({tstamp}), MAX({tstamp}) "
+            f"FROM data {'WHERE ' + ' AND '.join(where) if where else ''} "
+            "GROUP BY day ORDER BY day",
+            args,
+        ).fetchall()
+    finally:
+        db.close()
+
+    rows = np.array(rows, dtype=np.int64).reshape(-1, 4)
+    return pd.DataFrame({
+        "day": rows[:, 0].astype("datetime64[D]"),
+        "samples": rows[:, 1],
+        "first": rows[:, 2].astype("datetime64[ms]"),
+        "last": rows[:, 3].astype("datetime64[ms]"),
+    })
 
 
 # %% has_multiple_days_and_dates
@@ -187,19 +1215,12 @@ def has_multiple_days_and_dates(rsk_file):
         List of the dates found in the rsk fle even if there is only one
 
     """
-    with pyrsk.RSK(rsk_file) as rsk:
-
-        rsk.readdata()  # Load the data
+    # one query on the timestamps, no data read, cf. rsk_day_inventory
+    unique_dates = rsk_day_inventory(rsk_file)["day"].to_numpy().astype("datetime64[D]")
 
-    if rsk.data is None or len(rsk.data) == 0:
+    if len(unique_dates) == 0:
         return False  # No data means no multiple days
 
-    # Extract unique dates from the datetime column
-    timestamps = rsk.data["timestamp"]  # numpy.datetime64 array
-
-    dates = np.array([ts.astype("datetime64[D]") for ts in timestamps])
-    unique_dates = np.unique(dates)
-
     # unique_dates = {ts.date() for ts in rsk.data['timestamp']}
 
     return len(unique_dates) > 1, unique_dates
@@ -218,6 +1239,8 @@ def scan_rsk(path_in):
     Beware that if a raw rsk file name is _YYYYNNDD, it will be removed
     After the processing it removes the duplicated files. somettimes data of the day -1 
     are kept in day 1 rsk file, that will lead in two day-1 files identical
+    Days with identical data (same fingerprint) are detected before the split
+    and are not written at all
 
     Parameters
     ----------
@@ -254,9 +1277,14 @@ def scan_rsk(path_in):
     final_dates = []
     created_files = []
 
+    import pyrsktools as pyrsk
+
+    # days written so far, to skip the identical ones, cf. ScanSession
+    session = ScanSession()
+
     # loop on my list of files, input file is a rsk file
     for i, input_file in enumerate(rsk_files):
-        is_multiple, dates = rsksproc.has_multiple_days_and_dates(input_file)
+        is_multiple, dates = has_multiple_days_and_dates(input_file)
         # to create alist of final_dates
         print("found these dates in the files:", input_file)
         print(dates)
@@ -276,7 +1304,9 @@ def scan_rsk(path_in):
             print("found multiple dates in file:")
             print(input_file)
             # split the rsk if it is multiple, unique_days is a list of dates
-            created_files = rsksproc.split_rsk_by_day(input_file, proc_data_path)
+            created_files = split_rsk_by_day(
+                input_file, proc_data_path, session
+            )
 
         else:  # when no multiple date
             # we have to rename _YYYYmmdd when our file is not duplicate
@@ -287,12 +1317,16 @@ def scan_rsk(path_in):
             day_str = str(day).replace("-", "")
             # filename = f"split_{day_str}.rsk"
 
-            # Save the new RSK file
+            # Save the new RSK file, unless the same day is already written
             with pyrsk.RSK(input_file) as rsk:
-                rsk.readdata()
-                # Writes the new rsk file in the same folder and keep the original one
-                output_file = rsk.RSK2RSK(outputDir=proc_data_path,suffix=day_str)
-                created_files.append(output_file)
+                rsk.readdata()  # Load the data
+                output_file = os.path.join(
+                    proc_data_path, f"{Path(rsk.filename).stem}_{day_str}.rsk"
+                )
+                if not session.is_duplicate_day(output_file, day_str, rsk.data):
+                    # Writes the new rsk file in the same folder and keep the original one
+                    output_file = rsk.RSK2RSK(outputDir=proc_data_path,suffix=day_str)
+                    created_files.append(output_file)
 
     final_dates.sort(
         key=lambda d: datetime.strptime(d, "%Y-%m-%d")
@@ -303,7 +1337,8 @@ def scan_rsk(path_in):
         print(date)
 
     # remove duplicate files per day, some rsk files have the same day in it
-    result = remove_duplicates(proc_data_path)
+    # identical days have already been skipped by the session
+    result = remove_duplicates(proc_data_path, session.skipped)
 
     # sort files by date
     sorted_kept = sort_files_by_yymmdd(result["kept"])
@@ -321,16 +1356,22 @@ def scan_rsk(path_in):
 # %% remove_duplicates
 
 
-def remove_duplicates(path_in):
+def remove_duplicates(path_in, skipped=None):
     '''
     This functions scans a list of rsk files in a given folder and removes
     the rsk files that are duplicated. It outputs the files deleted and the
     files kept.
+    Files with identical data detected by their fingerprint during the scan
+    are never written, they are given in skipped and reported as deleted.
+    Among the remaining files of a same date, the most recent is kept.
 
     Parameters
     ----------
     path_in : str
         folder path containing the list of rsk files to check for duplicates
+    skipped : dict, optional
+        Dictionnary YYYYMMDD -> list of the day files not written because
+        identical to a kept one, cf. ScanSession. The default is None.
 
     Returns
     -------
@@ -354,10 +1395,22 @@ def remove_duplicates(path_in):
             date_str = match.group(1)
             files_by_date[date_str].append(f)
 
+    if skipped is None:
+        skipped = {}
+
     kept = []
     deleted = []
 
     for date_str, files in files_by_date.items():
+        if len(files) == 1 and skipped.get(date_str):
+            kept.append(files[0])
+            print(f"⚠️ Multiple files for date {date_str}. Keeping:")
+            print(f"   ➤ {os.path.basename(files[0])}")
+            for f in skipped[date_str]:
+                deleted.append(f)
+                print(f"   🗑️ Deleted: {os.path.basename(f)} (identical data, not written)")
+            continue
+
         if len(files) == 1:
             kept.append(files[0])
             print(
@@ -383,6 +1436,10 @@ def remove_duplicates(path_in):
             except Exception as e:
                 print(f"   ❗Error deleting {os.path.basename(f)}: {e}")
 
+        for f in skipped.get(date_str, []):
+            deleted.append(f)
+            print(f"   🗑️ Deleted: {os.path.basename(f)} (identical data, not written)")
+
     return {"kept": kept, "deleted": deleted}
 
 
@@ -401,7 +1458,8 @@ def sort_files_by_yymmdd(files):
 
 
 # %% *** procRSK ***
-def procRSK(path_in, patm, site_id, p_tresh, c_tresh, param, path_out):
+def procRSK(path_in, patm, site_id, p_tresh, c_tresh, param, path_out,
+            export_csv=True, profiler=None, profiles="best"):
     """
     This function is to process a raw rsk file containing one single SOMLIT 
     experiment on one single day. It applies all the required processing on the
@@ -431,6 +1489,18 @@ def procRSK(path_in, patm, site_id, p_tresh, c_tresh, param, path_out):
         destination file
     path_out : str
         Location path to the output folder of your choice for the processed data
+    export_csv : bool, optional
+        Writes the RBR csv files of the down and up casts. The default is True.
+        The SOMLIT files can be made from rsk_d and rsk_u without them,
+        cf. toSomlitDB_from_array
+    profiler : StageProfiler, optional
+        Records the time and memory of each processing step. The default is
+        None, no profiling
+    profiles : str, optional
+        "best" processes the deepest profile of the file only, "all" every
+        valid profile, cf. select_profiles. The corrections and derivations
+        are run once on the whole file in any case, the trimming and binning
+        on the profiles selected. The default is "best".
 
     Returns
     -------
@@ -442,26 +1512,40 @@ def procRSK(path_in, patm, site_id, p_tresh, c_tresh, param, path_out):
         RSK object containing the downcast data only
     rsk_u : RSK object
         RSK object containing the upcast data only
-    profile_nb : int
-        Profile number identified in the rsk file for this Somlit
+    profile_nb : int or List
+        Profile number identified in the rsk file for this Somlit, the list
+        of the profile numbers with profiles="all"
     file_output_folder : str
         Path to the output folder name for the specific profile
-    csv_d : str
-        Export filename of downcast
-    csv_u : str
-        Export filemane of upcast
+    csv_d : str or List
+        Export filename of downcast, None if export_csv is False. With
+        profiles="all" the list of the files, one per profile, labelled
+        by profile number
+    csv_u : str or List
+        Export filemane of upcast, None if export_csv is False. Same as
+        csv_d with profiles="all"
 
     """
+    import pyrsktools as pyrsk
+
+    # closes a profiled stage, nothing without profiler
+    lap = profiler.lap if profiler is not None else (lambda name: None)
+
     with pyrsk.RSK(path_in) as rsk:
 
-        # read the data first
+        # read the data first, only the channels needed for param
+        dropped = project_channels(rsk, param)
+        if dropped:
+            print("channels not read: " + ", ".join(dropped))
         rsk.readdata()
+        lap("readdata")
 
         # Removes atmopsheric pressure patm to calculate hydrostatic sea pressure
         # In an ideal way the barometric pressure must be measured at each somlit and entered here
         # remind: -1hPa (air pressure) = +1cm sealevel
         # -100hPa = -1dbar = +1m sealevel
         rsk.deriveseapressure(patm)
+        lap("deriveseapressure")
 
         # Computing profiles
 
@@ -470,15 +1554,18 @@ def procRSK(path_in, patm, site_id, p_tresh, c_tresh, param, path_out):
         # with acclimatation time are (0.05,5)
         # decreasing the treshold p_treshold detects more profiles
         raw = rsk.computeprofiles(p_tresh, c_tresh)
+        lap("computeprofiles")
 
         # Correct for A2D (analog to digital) zero-holder,
         # find the missing samples and interpolate
         # You must compute profile first before doing this otherwise error!!
         rsk.correcthold(action="interp")
+        lap("correcthold")
 
-        # identify proper profile number of interest
-        profile_nb = find_profile(rsk)
+        # identify proper profile number(s) of interest
+        profile_nb = select_profiles(rsk, profiles)
         print("procrsk profile nb is" + str(profile_nb))
+        lap("find_profile")
 
         # Low-pass filtering, windowlength is the number of values to use to calculate an average
         # We run at 2Hz, it is slower than the RBR (4Hz) so we won't apply any filter
@@ -491,6 +1578,7 @@ def procRSK(path_in, patm, site_id, p_tresh, c_tresh, param, path_out):
         # Select the channel to be corrected
         var = "temperature"
         rsk.alignchannel(channel=var, lag=deltat, lagunits="seconds")
+        lap("alignchannel")
 
         # Sensor proximity effect on conductivity (M. Dever)
         # Apply potential known proximity effect correction to conductivity
@@ -527,82 +1615,29 @@ def procRSK(path_in, patm, site_id, p_tresh, c_tresh, param, path_out):
         rsk.derivedepth(
             sites.sites[site_id]["latitude"], seawaterLibrary="TEOS-10"
         )
+        lap("derivedepth")
 
         # derive velocity , calculate velocity from depth and time
         # possible to add an argument here to do a window average of the salinity
         # not needed here as we go slow
         rsk.derivevelocity()
+        lap("derivevelocity")
         rsk.derivesalinity()
+        lap("derivesalinity")
         rsk.derivesigma()
+        lap("derivesigma")
 
         # Compensate DO values from salinity (jan.2026) from M.Dever ODO_EcoCTD script
-
-        # SUB-SAMPLING DO and temperature data from 8Hz at 1Hz
-        # we create newvariables DOXY but later on we will add them to new channels
-        DOXY = rsk.data["dissolved_o2_concentration"]
-        DOXY_raw = np.full_like(DOXY, np.nan)
-        DOXY_raw[::8] = DOXY[::8]
-        DOXY = DOXY_raw
-
-        # observe that temperature1 is the temp logger from the DO sensor
-        DOXY_TEMP = rsk.data["temperature1"]
-        DOXY_TEMP_raw = np.full_like(DOXY_TEMP, np.nan)
-        DOXY_TEMP_raw[::8] = DOXY_TEMP[::8]
-        DOXY_TEMP = DOXY_TEMP_raw
-
-        # Pressure compensation of DOXY data (if needed)
-        c0 = 3.2e-5
-        Fcp = 1 + c0 * (rsk.data["sea_pressure"] - patm)
-        DOXY = DOXY * Fcp
-
-        # Salinity compensation (if needed)
-        S = rsk.data["salinity"]
-        Ts = np.log(
-            (298.15 - rsk.data["temperature"])
-            / (273.15 + rsk.data["temperature"])
-        )
-        Fcs = np.exp(
-            S
-            * (
-                -6.24097e-3
-                - 6.93498e-3 * Ts
-                - 6.90358e-3 * Ts**2
-                - 4.29155e-3 * Ts**3
-            )
-            - 3.11680e-7 * S**2
-        )
-        DOXY = DOXY * Fcs
-
-        # Vertical alignment of DO measure
-        time = rsk.data["timestamp"]
-        time_sec = (time - time[0]) / np.timedelta64(1, "s")  # numeric seconds
-        # dp_dt is the vertical profiling speed
-        dp_dt = np.concatenate(
-            (
-                [0],
-                # since time is already in seconds
-                np.diff(rsk.data["sea_pressure"]) / np.diff(time_sec),
-            )
-        )
-        # set of a min speed 0.1
-        dp_dt[np.abs(dp_dt < 0.1)] = 0.1
-
-        # distance between CTD and optode [m]
-        offset = 0.472
-
-        # compute advective lag [in s]; that is the time it takes for a water parcel to
-        # travel the "offset" distance, given the profiling speed "dpdt"
-        lag_adv = offset / dp_dt
-
-        mask = ~np.isnan(DOXY)  # boolean showing true for nonNan values only
-
-        # a shift of DOXY time is done to align with CTD measurements
-        DOXY[mask] = np.interp(
-            time_sec[mask] + lag_adv[mask], time_sec[mask], DOXY[mask]
-        )
-        # a shift of temperature1 time is done to align with CTD measurements
-        DOXY_TEMP[mask] = np.interp(
-            time_sec[mask] + lag_adv[mask], time_sec[mask], DOXY_TEMP[mask]
+        # DO and temperature1 sub-sampled at 1Hz, compensated for pressure
+        # and salinity and aligned with the CTD, cf. compensate_do
+        DOXY, DOXY_TEMP = compensate_do(
+            rsk.data["timestamp"],
+            rsk.data["sea_pressure"],
+            rsk.data["salinity"],
+            rsk.data["temperature"],
+            rsk.data["dissolved_o2_concentration"],
+            rsk.data["temperature1"],
+            patm,
         )
 
         # create a new channel to attribute the DO corrected data calculated above
@@ -617,6 +1652,7 @@ def procRSK(path_in, patm, site_id, p_tresh, c_tresh, param, path_out):
             isMeasured=1,
             isDerived=0,
         )
+        lap("do_compensation")
 
         # Remove loops, this functions removes data or put it "nan". They must be handled later on
         # removing loops due to swell and probe measuring its wake
@@ -631,6 +1667,7 @@ def procRSK(path_in, patm, site_id, p_tresh, c_tresh, param, path_out):
         # if you are slow, put a treshold near you speed value
         # if you are fast, treshold near 0, to be confirmed
         rsk.removeloops(direction="down", threshold=0.05)
+        lap("removeloops")
 
         # trim the data to remove unwanted values out of range
         rsk.trim(
@@ -640,12 +1677,7 @@ def procRSK(path_in, patm, site_id, p_tresh, c_tresh, param, path_out):
             direction="both",
             action="remove",
         )
-        # create a copy to run independant processes for binaveraging and export
-        # on chosen up and down casts
-        rsk_u = rsk.copy()
-        rsk_d = rsk.copy()
-
-        # perhaps write a loop for the part below
+        lap("trim")
 
         # Binning parameters to achieve one value per 0.25 m
         # choose bin Size here and depth limits for the binning process
@@ -654,33 +1686,31 @@ def procRSK(path_in, patm, site_id, p_tresh, c_tresh, param, path_out):
         start_d = start_depth - (bin_size / 2)
         # this parameter must be checked for not loosing data on downcast
         # on somlit the profile is short (shallow depth) and we don't want to loose data
-        end_d = int(np.nanmax(rsk_d.data["depth"]) // bin_size) * bin_size
+        end_d = int(np.nanmax(rsk.data["depth"]) // bin_size) * bin_size
 
         # contact RBR to do the binning on both up and down
-        # Binning down cast
-        # bin average on depth 0.25dbar or 25 cm for DOWN cast
-        rsk_d.binaverage(
-            profiles=profile_nb,  # we apply the binning only on our profile of interest
-            binBy="depth",
-            binSize=bin_size,
-            boundary=[start_d, end_d],  # parameter to start at 0.75m depth
-            # be carefull, choose start depth - binsize/2 to have the value starting the boundary
-            direction="down",
-        )
-
-        # Binning up cast
-        rsk_u.binaverage(
-            profiles=profile_nb,  # we apply the binning only on our profile of interest
-            binBy="depth",
-            binSize=bin_size,
-            # parameter to start at 0.75m depth, handking "nan' values
-            boundary=[
-                start_depth,
-                round(np.nanmax(rsk_u.data["depth"])) + start_d,
-            ],
-            # be carefull, choose start depth - binsize/2 to have the value starting the boundary
-            direction="up",
+        # bin average on depth 0.25dbar or 25 cm of the DOWN and UP casts
+        # of our profile(s) of interest, both casts at once, on the same bins
+        # for all the profiles, cf. binaverage_casts
+        binned = binaverage_casts(
+            rsk,
+            profile_nb,
+            bin_size,
+            {
+                # parameter to start at 0.75m depth
+                # be carefull, choose start depth - binsize/2 to have the value starting the boundary
+                "down": [start_d, end_d],
+                # parameter to start at 0.75m depth, handking "nan' values
+                "up": [start_depth, round(np.nanmax(rsk.data["depth"])) + start_d],
+            },
         )
+        # light copies of rsk holding the binned casts, for the exports
+        # on chosen up and down casts, cf. cast_view
+        rsk_d = cast_view(rsk, data=binned["down"][0])
+        rsk_d.appendlog(binned["down"][1])
+        rsk_u = cast_view(rsk, data=binned["up"][0])
+        rsk_u.appendlog(binned["up"][1])
+        lap("binaverage")
 
         # create a subfolder for this specific rsk file
         # Extract the base filename without extension
@@ -698,26 +1728,50 @@ def procRSK(path_in, patm, site_id, p_tresh, c_tresh, param, path_out):
             os.makedirs(newpath_u)
             os.makedirs(newpath_d)
 
-        # save required variables in a csv with the correct format
-        # export down cast
-        rsk_d.RSK2CSV(
-            channels=param,  # list of parameters in argument
-            profiles=profile_nb,
-            comment="down CAST",
-            outputDir=newpath_d,
-        )
-        # save export file name down cast because rsk2csv does not output it
-        csv_d = rsk_to_profile_csv(newpath_d, 0)
-
-        # export upcast
-        rsk_u.RSK2CSV(
-            channels=param,
-            profiles=profile_nb,
-            comment="up CAST",
-            outputDir=newpath_u,
-        )
-        # save export file name down cast because rsk2csv does not output it
-        csv_u = rsk_to_profile_csv(newpath_u, 0)
+        csv_d = None
+        csv_u = None
+        if export_csv and profiles == "all":
+            # one file per profile, renamed after its profile number as
+            # RSK2CSV numbers the files it writes from 0
+            csv_d = []
+            csv_u = []
+            for n in profile_nb:
+                for rsk_cast, newpath, comment, csv_list in (
+                    (rsk_d, newpath_d, "down CAST", csv_d),
+                    (rsk_u, newpath_u, "up CAST", csv_u),
+                ):
+                    rsk_cast.RSK2CSV(
+                        channels=param,
+                        profiles=n,
+                        comment=comment,
+                        outputDir=newpath,
+                    )
+                    csv_list.append(rsk_to_profile_csv(newpath, n))
+                    os.replace(rsk_to_profile_csv(newpath, 0), csv_list[-1])
+            lap("RSK2CSV")
+        elif export_csv:
+            # save required variables in a csv with the correct format
+            # export down cast
+            rsk_d.RSK2CSV(
+                channels=param,  # list of parameters in argument
+                profiles=profile_nb,
+                comment="down CAST",
+                outputDir=newpath_d,
+            )
+            # save export file name down cast because rsk2csv does not output it
+            csv_d = rsk_to_profile_csv(newpath_d, 0)
+            lap("RSK2CSV_down")
+
+            # export upcast
+            rsk_u.RSK2CSV(
+                channels=param,
+                profiles=profile_nb,
+                comment="up CAST",
+                outputDir=newpath_u,
+            )
+            # save export file name down cast because rsk2csv does not output it
+            csv_u = rsk_to_profile_csv(newpath_u, 0)
+            lap("RSK2CSV_up")
 
         # output
         return (
@@ -733,12 +1787,21 @@ def procRSK(path_in, patm, site_id, p_tresh, c_tresh, param, path_out):
 
 
 # %% process_rsk_folder
-def process_rsk_folder(path_in, list_of_rsk, site_id, p_tresh, c_tresh, patm, param):
+def process_rsk_folder(path_in, list_of_rsk, site_id, p_tresh, c_tresh, patm, param,
+                       workers=1, force=False, export_csv=True, dataset_dir=None,
+                       figures="channel", figure_workers=0, progress=None,
+                       profile=False, profiles="best"):
     '''
     This function is to procees a list of files in a chosen folder and apply
     the function process_rsk_file on each file
     # list of correct rsk files to process is given in argument
     # the loop does not properly work certainly because of the variable of the profle_nb that does not update in the loop.
+    Each day file is independent, with workers > 1 the files are processed
+    in parallel by a pool of processes. The results keep the chronological
+    order of the files whatever the order they finish in.
+    A run manifest is kept in the outputs folder, cf. load_manifest. A file
+    already processed with the same content and the same parameters, and
+    whose outputs are still there, is skipped unless force is True.
 
     Parameters
     ----------
@@ -757,10 +1820,45 @@ def process_rsk_folder(path_in, list_of_rsk, site_id, p_tresh, c_tresh, patm, pa
     param : List
         List of channel names that you want to keep in your processed RBR. csv
         destination file
+    workers : int, optional
+        Number of processes used to process the files. The default is 1,
+        the files are then processed one after the other in this process
+    force : bool, optional
+        Reprocess all the files even if the manifest says they are up to
+        date. The default is False.
+    export_csv : bool, optional
+        Writes the RBR csv files of the casts, cf. procRSK. The default is True.
+    dataset_dir : str, optional
+        Folder of a Parquet dataset, partitioned by ID_SITE/year/date, where
+        the binned casts of every file processed are appended, cf.
+        append_to_dataset. Needs pyarrow. The default is None, no dataset.
+    figures : str, optional
+        How the figures are made, cf. process_rsk_file. The default is
+        "channel", one figure per channel. "none" makes no figure at all.
+    figure_workers : int, optional
+        Number of processes rendering the per-channel figures as a separate
+        stage. The default is 0, the figures are made inline by
+        process_rsk_file. With figure_workers > 0 each file only prepares
+        compact figure jobs, the SOMLIT files are written first and the
+        figures fill in concurrently on the figure pool. Only for the
+        per-channel figures, ValueError with figures="batch".
+    progress : callable, optional
+        Called as progress(done, total, result) each time a file is done,
+        skipped files included, e.g. to show a progress bar. The default is
+        None.
+    profile : bool, optional
+        Profiles the processing stages of each file, cf. process_rsk_file.
+        The reports are also in the results. The default is False.
+    profiles : str, optional
+        "best" processes the deepest profile of each file, "all" every valid
+        profile, cf. process_rsk_file. The default is "best".
 
     Returns
     -------
-    None.
+    results : List
+        List of the dictionnaries returned by process_rsk_file, one per file,
+        sorted by date. Files skipped thanks to the manifest have 'skipped'
+        set to True
 
     '''
 
@@ -769,6 +1867,13 @@ def process_rsk_folder(path_in, list_of_rsk, site_id, p_tresh, c_tresh, patm, pa
     # get the dir a step up
     # parent_dir = os.path.dirname(path_in)
     
+    # the figure pool renders per-channel figures, not the batch figure
+    if figures == "batch" and figure_workers > 0:
+        raise ValueError(
+            'figures="batch" is drawn inline, it cannot be used with '
+            "figure_workers > 0"
+        )
+
     path_out = os.path.join(path_in, "outputs")
     # creates the path_out directory woth proc_data if it don't already exists
     os.makedirs(path_out, exist_ok=True)
@@ -804,22 +1909,448 @@ def process_rsk_folder(path_in, list_of_rsk, site_id, p_tresh, c_tresh, patm, pa
     for f in valid_sorted:
         print(f" - {os.path.basename(f)}")  # show the list of files to process
 
-    for i, input_file in enumerate(valid_sorted):
-        print(
-            f"\n--- Processing file {i +
-                                     1}/{len(valid_files_to_process)}: {input_file} ---"
+    # compare the files with the manifest of the previous runs
+    manifest = load_manifest(path_out)
+    params = {
+        "patm": float(patm),
+        "p_tresh": float(p_tresh),
+        "c_tresh": float(c_tresh),
+        "site_id": int(site_id),
+        "param": list(param),
+        "export_csv": bool(export_csv),
+        "dataset_dir": (
+            None if dataset_dir is None else os.path.abspath(dataset_dir)
+        ),
+        "figures": figures,
+        "profile": bool(profile),
+        "profiles": profiles,
+    }
+    hashes = {}
+    results_by_file = {}
+    to_process = []
+
+    def report(result):
+        if progress is not None:
+            progress(len(results_by_file) + len(results), len(valid_sorted), result)
+
+    results = []
+    for input_file in valid_sorted:
+        hashes[input_file] = file_hash(input_file)
+        entry = manifest["files"].get(os.path.basename(input_file))
+        if not force and is_up_to_date(entry, hashes[input_file], params, path_out):
+            print(f"⏭️ Unchanged, skipped: {os.path.basename(input_file)}")
+            results_by_file[input_file] = {
+                "file": input_file,
+                "output_folder": os.path.join(path_out, entry["output_folder"]),
+                "success": True,
+                "skipped": True,
+                "error": None,
+                "traceback": None,
+                "figure_errors": [],
+            }
+            report(results_by_file[input_file])
+        else:
+            to_process.append(input_file)
+
+    # figures rendered on their own pool, off the data products path
+    deferred = figure_workers > 0 and figures != "none"
+    file_figures = "deferred" if deferred else figures
+    figure_executor = None
+    figure_futures = []
+    if deferred:
+        figure_executor = ProcessPoolExecutor(max_workers=figure_workers)
+
+    if workers <= 1 or len(to_process) <= 1:
+        for i, input_file in enumerate(to_process):
+            print(
+                f"\n--- Processing file {i +
+                                         1}/{len(to_process)}: {input_file} ---"
+            )
+            results.append(
+                process_rsk_file(
+                    input_file, path_out, site_id, p_tresh, c_tresh, patm, param,
+                    export_csv=export_csv, dataset_dir=dataset_dir,
+                    figures=file_figures, profile=profile, profiles=profiles,
+                )
+            )
+            figure_futures += submit_figure_jobs(figure_executor, results[-1])
+            report(results[-1])
+        # the batch figure of this process is not needed anymore
+        if figures == "batch":
+            import RSKsomlit_plt as rsksplt
+
+            rsksplt.release_batch_figure()
+    else:
+        n_workers = min(workers, len(to_process))
+        print(f"\n--- Processing {len(to_process)} files on {n_workers} workers ---")
+        with ProcessPoolExecutor(max_workers=n_workers) as executor:
+            # futures are kept in the sorted order of the files
+            futures = [
+                executor.submit(
+                    process_rsk_file,
+                    input_file, path_out, site_id, p_tresh, c_tresh, patm, param,
+                    export_csv=export_csv, dataset_dir=dataset_dir,
+                    figures=file_figures, profile=profile, profiles=profiles,
+                )
+                for input_file in to_process
+            ]
+            for input_file, future in zip(to_process, futures):
+                try:
+                    results.append(future.result())
+                    figure_futures += submit_figure_jobs(
+                        figure_executor, results[-1]
+                    )
+                except Exception as e:
+                    # the worker itself died, process_rsk_file catches the rest
+                    results.append(
+                        {
+                            "file": input_file,
+                            "output_folder": None,
+                            "success": False,
+                            "skipped": False,
+                            "error": f"{type(e).__name__}: {e}",
+                            "traceback": traceback.format_exc(),
+                            "figure_errors": [],
+                        }
+                    )
+                report(results[-1])
+
+    # wait for the figures before listing the outputs in the manifest
+    if figure_executor is not None:
+        print(f"\n--- Waiting for {len(figure_futures)} figures ---")
+        for result, param_name, future in figure_futures:
+            try:
+                future.result()
+            except Exception as e:
+                # a missing figure does not fail the day, it is reported
+                result["figure_errors"].append(f"{param_name}: {type(e).__name__}: {e}")
+                print(f"⚠️ Figure {param_name} failed for {
+                    os.path.basename(result['file'])}: {e}")
+        figure_executor.shutdown()
+
+    # record the files processed successfully in the manifest
+    for r in results:
+        results_by_file[r["file"]] = r
+        if r["success"]:
+            manifest["files"][os.path.basename(r["file"])] = {
+                "hash": hashes[r["file"]],
+                "params": params,
+                "output_folder": os.path.relpath(r["output_folder"], path_out),
+                "outputs": list_outputs(r["output_folder"], path_out),
+                "processed": datetime.now().isoformat(timespec="seconds"),
+            }
+        else:
+            manifest["files"].pop(os.path.basename(r["file"]), None)
+    save_manifest(path_out, manifest)
+
+    # back to the chronological order, skipped files included
+    results = [results_by_file[f] for f in valid_sorted]
+
+    failed = [r for r in results if not r["success"]]
+    skipped = [r for r in results if r["skipped"]]
+    print(
+        f"\n✅ {len(results) - len(failed) - len(skipped)} file(s) processed, "
+        f"⏭️ {len(skipped)} skipped, ❌ {len(failed)} failed"
+    )
+    for r in failed:
+        print(f" - {os.path.basename(r['file'])}: {r['error']}")
+
+    return results
+
+
+# %% submit_figure_jobs
+
+
+def submit_figure_jobs(executor, result):
+    '''
+    Submits the figure jobs prepared by process_rsk_file (figures="deferred")
+    to the figure pool. The jobs are removed from the result so the arrays
+    are not kept once sent
+
+    Parameters
+    ----------
+    executor : ProcessPoolExecutor or None
+        figure pool of process_rsk_folder, nothing is done if None
+    result : dict
+        result of process_rsk_file
+
+    Returns
+    -------
+    List
+        List of (result, channel name, future), one per figure
+
+    '''
+    jobs = result.pop("figure_jobs", None)
+    if executor is None or not jobs:
+        return []
+    import RSKsomlit_plt as rsksplt
+
+    return [
+        (result, job["param"], executor.submit(rsksplt.render_up_down_job, job))
+        for job in jobs
+    ]
+
+
+# %% run manifest
+MANIFEST_NAME = "rsk_manifest.json"
+
+
+def file_hash(path, chunk_size=1 << 20):
+    """
+    Computes the blake2b hash of a file content, read chunk by chunk
+
+    Parameters
+    ----------
+    path : str
+        Path to the file
+    chunk_size : int, optional
+        Size of the chunks read in bytes. The default is 1 MB.
+
+    Returns
+    -------
+    str
+        hexadecimal hash of the file content
+
+    """
+    h = hashlib.blake2b(digest_size=16)
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def load_manifest(path_out):
+    """
+    Loads the run manifest of an outputs folder. The manifest records for
+    each input rsk file its content hash, the processing parameters and the
+    outputs produced, to skip the unchanged files on the next runs.
+    Returns an empty manifest if there is none or if it is unreadable
+
+    Parameters
+    ----------
+    path_out : str
+        outputs folder of process_rsk_folder
+
+    Returns
+    -------
+    manifest : dict
+        {'files': {file name: entry}}
+
+    """
+    manifest_path = os.path.join(path_out, MANIFEST_NAME)
+    try:
+        with open(manifest_path, "r") as f:
+            manifest = json.load(f)
+    except (OSError, ValueError):
+        return {"files": {}}
+    if not isinstance(manifest.get("files"), dict):
+        return {"files": {}}
+    return manifest
+
+
+def save_manifest(path_out, manifest):
+    """
+    Writes the run manifest in the outputs folder. The file is written
+    aside then renamed so an interrupted run never leaves a broken manifest
+
+    Parameters
+    ----------
+    path_out : str
+        outputs folder of process_rsk_folder
+    manifest : dict
+        manifest as returned by load_manifest
+
+    Returns
+    -------
+    None.
+
+    """
+    manifest_path = os.path.join(path_out, MANIFEST_NAME)
+    tmp_path = manifest_path + ".tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(manifest, f, indent=2)
+    os.replace(tmp_path, manifest_path)
+
+
+def list_outputs(output_folder, path_out):
+    """
+    Lists the files produced in an output folder, relative to path_out
+
+    Parameters
+    ----------
+    output_folder : str
+        output folder of one rsk file
+    path_out : str
+        outputs folder of process_rsk_folder
+
+    Returns
+    -------
+    List
+        sorted list of the relative paths of the files
+
+    """
+    outputs = []
+    for root, dirs, files in os.walk(output_folder):
+        for file in files:
+            outputs.append(os.path.relpath(os.path.join(root, file), path_out))
+    return sorted(outputs)
+
+
+def is_up_to_date(entry, content_hash, params, path_out):
+    """
+    Checks if a manifest entry matches the current content and parameters
+    of a file and if all its recorded outputs still exist
+
+    Parameters
+    ----------
+    entry : dict or None
+        manifest entry of the file, None if never processed
+    content_hash : str
+        current hash of the file, cf. file_hash
+    params : dict
+        current processing parameters
+    path_out : str
+        outputs folder of process_rsk_folder
+
+    Returns
+    -------
+    bool
+        True if the file does not need to be processed again
+
+    """
+    if not entry:
+        return False
+    if entry.get("hash") != content_hash or entry.get("params") != params:
+        return False
+    outputs = entry.get("outputs")
+    if not outputs:
+        return False
+    return all(os.path.isfile(os.path.join(path_out, f)) for f in outputs)
+
+
+# %% columnar dataset
+
+
+def cast_dataset_frame(rsk_d, rsk_u, param, profile_nb, site_id, source):
+    '''
+    Function to gather the binned down and up casts of one processed file in
+    one long frame for the columnar dataset: one row per depth bin and cast,
+    one column per channel of param, plus the cast direction, the profile
+    number, the source file and the partition columns ID_SITE, year and date
+
+    Parameters
+    ----------
+    rsk_d : RSK object
+        RSK object containing the binned downcast, cf. procRSK
+    rsk_u : RSK object
+        RSK object containing the binned upcast, cf. procRSK
+    param : List
+        List of channel names to keep
+    profile_nb : int or List
+        Profile number(s) identified in procRSK, each row is labelled with
+        the number of its profile
+    site_id : int
+        Somlit site id where RBR data have been collected: cf sites.py
+    source : str
+        name of the processed file, without extension
+
+    Returns
+    -------
+    df : DataFrame
+        binned casts of the file
+
+    '''
+    frames = []
+    for rsk_cast, direction in ((rsk_d, "down"), (rsk_u, "up")):
+        channel_names, channel_units = rsk_cast.getchannelnamesandunits(param)
+        cast_indices = rsk_cast.getprofilesindices(profile_nb, direction)
+        indices = np.concatenate(
+            [np.asarray(i, dtype=np.intp) for i in cast_indices]
         )
-        rsksproc.process_rsk_file(
-            input_file, path_out, site_id, p_tresh, c_tresh, patm, param
+        data = rsk_cast.data[indices]
+
+        df = pd.DataFrame({"timestamp": data["timestamp"]})
+        for name in channel_names:
+            df[name] = data[name]
+        df["cast_direction"] = direction
+        df["profile"] = np.repeat(
+            np.atleast_1d(profile_nb), [len(i) for i in cast_indices]
         )
+        frames.append(df)
+
+    df = pd.concat(frames, ignore_index=True)
+    df["source"] = source
+    # partition columns
+    df["ID_SITE"] = site_id
+    df["year"] = df["timestamp"].dt.year
+    df["date"] = df["timestamp"].dt.strftime("%Y-%m-%d")
+
+    return df
+
+
+def append_to_dataset(df, dataset_dir, source):
+    '''
+    Function to append the binned casts of one file to a Parquet dataset
+    partitioned by ID_SITE/year/date (hive style, eg.
+    ID_SITE=5/year=2025/date=2025-06-02). Each file writes its own parquet
+    files named after the source, so processing the file again replaces its
+    data instead of duplicating it, and parallel workers do not collide.
+    Requires pyarrow
+
+    Parameters
+    ----------
+    df : DataFrame
+        binned casts of the file, cf. cast_dataset_frame
+    dataset_dir : str
+        Folder of the dataset, created if needed
+    source : str
+        name of the processed file, without extension
+
+    Returns
+    -------
+    None.
+
+    '''
+    try:
+        import pyarrow as pa
+        import pyarrow.dataset as ds
+    except ImportError as e:
+        raise ImportError(
+            "pyarrow is needed to write the Parquet dataset: pip install pyarrow"
+        ) from e
+
+    os.makedirs(dataset_dir, exist_ok=True)
+
+    table = pa.Table.from_pandas(df, preserve_index=False)
+    partitioning = ds.partitioning(
+        pa.schema(
+            [
+                ("ID_SITE", table.schema.field("ID_SITE").type),
+                ("year", table.schema.field("year").type),
+                ("date", pa.string()),
+            ]
+        ),
+        flavor="hive",
+    )
+    ds.write_dataset(
+        table,
+        dataset_dir,
+        format="parquet",
+        partitioning=partitioning,
+        basename_template=f"{source}-{{i}}.parquet",
+        existing_data_behavior="overwrite_or_ignore",
+    )
+    print(f"Appended {len(df)} rows to dataset: {dataset_dir}")
 
 
 # %% process_rsk_file
 #
-def process_rsk_file(input_file, path_out, site_id, p_tresh, c_tresh, patm, param):
+def process_rsk_file(input_file, path_out, site_id, p_tresh, c_tresh, patm, param,
+                     export_csv=True, dataset_dir=None, figures="channel",
+                     profile=False, profiles="best"):
     '''
     This function does the processing on a single rsk file only. The rsk file
-    is supposed to contain only one profile
+    is supposed to contain only one profile, unless profiles is "all"
     It is the same as process_rsk_folder but applied for one file only
     It creates the figures and csv in a folder nammed after the file name
 
@@ -840,11 +2371,43 @@ def process_rsk_file(input_file, path_out, site_id, p_tresh, c_tresh, patm, para
     param : List
         List of channel names that you want to keep in your processed RBR. csv
         destination file      
-
+    export_csv : bool, optional
+        Writes the RBR csv files of the casts, cf. procRSK. The default is True.
+        The SOMLIT files are made from the binned data in memory in any case
+    dataset_dir : str, optional
+        Folder of the Parquet dataset where the binned casts are appended,
+        cf. append_to_dataset. The default is None, no dataset.
+    figures : str, optional
+        "channel": one figure per channel with plot_up_down2, the default
+        "batch": one headless figure with all the channels, with
+        plot_up_down_batch, for batch runs
+        "deferred": no figure drawn, compact figure jobs are returned in the
+        result to be rendered elsewhere, cf. process_rsk_folder
+        "none": no figure at all
+    profile : bool, optional
+        Profiles the processing stages, cf. StageProfiler, and writes the
+        report as PROFILE_NAME in the output folder of the file.
+        The default is False.
+    profiles : str, optional
+        "best" processes the deepest profile only, "all" every valid profile
+        of the file, cf. procRSK. With "all" the SOMLIT files are labelled by
+        profile number, <file>_profile<n>_4somlit_d.csv, and the figures of
+        each profile are in a profile<n> subfolder. The default is "best".
 
     Returns
     -------
-    None.
+    result : dict
+        Dictionnary with the processing status of the file:
+            'file': the input file
+            'output_folder': folder of the outputs
+            'success': True if processed, False if an exception occured
+            'skipped': always False here, True is set by process_rsk_folder
+            'error': the exception message, None on success
+            'traceback': the exception traceback, None on success
+            'figure_errors': figures that failed, filled by process_rsk_folder
+            'figure_jobs': only with figures="deferred", cf.
+                           RSKsomlit_plt.up_down_figure_jobs
+            'profile': the StageProfiler report with profile=True
 
     '''
     # Extract the base filename without extension
@@ -854,13 +2417,16 @@ def process_rsk_file(input_file, path_out, site_id, p_tresh, c_tresh, patm, para
     file_output_folder = os.path.join(path_out, base)
     os.makedirs(file_output_folder, exist_ok=True)
 
-    # Define paths for intermediate and final output
-    final_csv_d = os.path.join(
-        file_output_folder + "/downcast", f"{base}_4somlit_d.csv"
-    )
-    final_csv_u = os.path.join(
-        file_output_folder + "/upcast", f"{base}_4somlit_u.csv"
-    )
+    result = {
+        "file": input_file,
+        "output_folder": file_output_folder,
+        "success": False,
+        "skipped": False,
+        "error": None,
+        "traceback": None,
+        "figure_errors": [],
+    }
+    profiler = StageProfiler(input_file) if profile else None
     try:
         print(f"🔄 Processing: {input_file}")
 
@@ -874,28 +2440,93 @@ def process_rsk_file(input_file, path_out, site_id, p_tresh, c_tresh, patm, para
             file_output_folder,
             csv_d,
             csv_u,
-        ) = rsksproc.procRSK(
-            input_file, patm, site_id, p_tresh, c_tresh, param, path_out
+        ) = procRSK(
+            input_file, patm, site_id, p_tresh, c_tresh, param, path_out,
+            export_csv, profiler, profiles,
         )
 
+        # outputs of each profile: name of the SOMLIT files and folder of the
+        # figures, labelled by profile number with several profiles
+        if profiles == "all":
+            outputs = {
+                n: (f"{base}_profile{n}", os.path.join(file_output_folder, f"profile{n}"))
+                for n in profile_nb
+            }
+        else:
+            outputs = {profile_nb: (base, file_output_folder)}
+
         print(f"Output folder: {file_output_folder}")
         print(f"CSV D path: {csv_d}, CSV U path: {csv_u}")
         print(f"Profile number: {profile_nb}")
 
         # Step 2: Plot
         exclude = ["pressure", "sea_pressure", "depth"]
-        for param in [x for x in param if x not in exclude]:
-            rsksplt.plot_up_down2(
-                rsk_d, rsk_u, param, profile_nb, file_output_folder
+        channels = [x for x in param if x not in exclude]
+        if figures != "none":
+            import RSKsomlit_plt as rsksplt
+
+        figure_jobs = []
+        for n, (label, figure_folder) in outputs.items():
+            if figures == "none":
+                pass
+            elif figures == "deferred":
+                figure_jobs += rsksplt.up_down_figure_jobs(
+                    rsk_d, rsk_u, channels, n, figure_folder
+                )
+            elif figures == "batch":
+                rsksplt.plot_up_down_batch(
+                    rsk_d, rsk_u, channels, n, figure_folder
+                )
+            else:
+                for channel in channels:
+                    rsksplt.plot_up_down2(
+                        rsk_d, rsk_u, channel, n, figure_folder
+                    )
+        if profiler is not None:
+            profiler.lap("figures")
+
+        # Step 3: Convert to SOMLIT format, from the binned data in memory
+        for n, (label, _) in outputs.items():
+            final_csv_d = os.path.join(
+                file_output_folder + "/downcast", f"{label}_4somlit_d.csv"
+            )
+            final_csv_u = os.path.join(
+                file_output_folder + "/upcast", f"{label}_4somlit_u.csv"
+            )
+            toSomlitDB_from_array(
+                *rsk_cast_to_array(rsk_d, param, n), site_id, final_csv_d
             )
+            toSomlitDB_from_array(
+                *rsk_cast_to_array(rsk_u, param, n), site_id, final_csv_u
+            )
+        if profiler is not None:
+            profiler.lap("somlit_export")
+
+        # Step 4: Append the binned casts to the columnar dataset
+        if dataset_dir is not None:
+            df = cast_dataset_frame(rsk_d, rsk_u, param, profile_nb, site_id, base)
+            append_to_dataset(df, dataset_dir, base)
+            if profiler is not None:
+                profiler.lap("dataset")
 
-        # Step 3: Convert to SOMLIT format
-        rsksproc.toSomlitDB(csv_d, site_id, final_csv_d)
-        rsksproc.toSomlitDB(csv_u, site_id, final_csv_u)
+        if profiler is not None:
+            profiler.stop()
+            profiler.save(file_output_folder)
+            result["profile"] = profiler.report()
 
         print(f"✅ Done: Output in {file_output_folder}")
+        result["success"] = True
+        if figures == "deferred":
+            result["figure_jobs"] = figure_jobs
     except Exception as e:
         print(f"❌ Failed for {input_file}: {e}")
+        result["error"] = f"{type(e).__name__}: {e}"
+        result["traceback"] = traceback.format_exc()
+    finally:
+        if profiler is not None:
+            profiler.stop()
+
+    return result
 
 
 # %% rsk_to_profile_csv
@@ -926,7 +2557,7 @@ def rsk_to_profile_csv(dir_path, profile_nb=0):
 
 # %% split_rsk_by_day
 
-def split_rsk_by_day(mrsk_file, output_dir):
+def split_rsk_by_day(mrsk_file, output_dir, session=None):
     '''
     Function to process mrsk file. A mrsk file is a RSK file containing multiple somlit days in it.
     It comes because the RBR probe has been set on pause between the Somlits. Therefore several somlit days
@@ -939,6 +2570,9 @@ def split_rsk_by_day(mrsk_file, output_dir):
         Path to the multiple RSK file to split
     output_dir : str
         Directory adress to save the newly created rsk
+    session : ScanSession, optional
+        Scan session keeping the days already written, to skip the
+        identical ones. The default is None, a new session for this call
 
     Returns
     -------
@@ -949,34 +2583,31 @@ def split_rsk_by_day(mrsk_file, output_dir):
     # mrsk_file is a file containing several days, several somlits
 
     created_files = []  # list of created files
-    with pyrsk.RSK(mrsk_file) as rsk:
-        rsk.readdata()
+    if session is None:
+        session = ScanSession()
 
-        # Extract unique dates from the datetime column
-        timestamps = rsk.data["timestamp"]  # numpy.datetime64 array
+    # Loop through each day, read one after the other, and save a new .rsk file
+    for rsk, day, data in session.iter_days(mrsk_file):
+        # Construct filename
+        day_str = str(day).replace("-", "")
 
-        dates = np.array([ts.astype("datetime64[D]") for ts in timestamps])
-        unique_days = np.unique(dates)
-
-        # Loop through each unique day and save a new .rsk file
-        for day in unique_days:
-            # Get mask for rows matching this day
-            # mask says true or false if the date is in unique_day
-            mask = dates == day
-            # completely new copy of the rsk file
-            day_rsk = rsk.copy()
-            day_rsk.data = rsk.data[mask]  # Filtered data
+        # skip the day if the same data have already been written
+        output_file = os.path.join(
+            output_dir, f"{Path(rsk.filename).stem}_{day_str}.rsk"
+        )
+        if session.is_duplicate_day(output_file, day_str, data):
+            continue
 
-            # Construct filename
-            day_str = str(day).replace("-", "")
+        # light copy of the rsk file holding the data of the day, cf. cast_view
+        day_rsk = cast_view(rsk, data=data)
 
-            # Save the new RSK file
-            output_file = day_rsk.RSK2RSK(outputDir=output_dir, suffix=day_str)  # Writes the file
-            created_files.append(output_file)
+        # Save the new RSK file
+        output_file = day_rsk.RSK2RSK(outputDir=output_dir, suffix=day_str)  # Writes the file
+        created_files.append(output_file)
 
-            print(f"✅ Saved: {output_file}")
+        print(f"✅ Saved: {output_file}")
 
-        return created_files
+    return created_files
 
 
 # %% toSomlitDB
@@ -1030,9 +2661,10 @@ def toSomlitDB(file_path, site_id, output_file):
     # remove line with nan
     df = df.dropna()
 
-    # Convert the first column to datetime using your format
-    df.iloc[:, 0] = pd.to_datetime(
-        df.iloc[:, 0], format="%Y-%m-%dT%H:%M:%S.%f"
+    # Convert the first column to datetime using your format, the column
+    # is replaced as a whole: pandas 3 refuses datetimes set into a str column
+    df[df.columns[0]] = pd.to_datetime(
+        df[df.columns[0]], format="%Y-%m-%dT%H:%M:%S.%f"
     )
 
     # Set the first column as the index, and avoid warning caused
@@ -1040,6 +2672,116 @@ def toSomlitDB(file_path, site_id, output_file):
     df[df.columns[0]] = df[df.columns[0]].infer_objects()
     df.set_index(df.columns[0], inplace=True)
 
+    somlit_frame_to_file(df, site_id, output_file)
+
+
+# %% toSomlitDB_from_array
+
+
+def rsk_cast_to_array(rsk_cast, param, profile_nb):
+    '''
+    Function to extract from a binned RSK object (rsk_d or rsk_u of procRSK)
+    the rows and channels that RSK2CSV would write for the profile profile_nb,
+    ie. the downcast rows then the upcast rows of the profile.
+    Used to feed toSomlitDB_from_array without going through the RBR csv
+
+    Parameters
+    ----------
+    rsk_cast : RSK object
+        RSK object binned by procRSK, rsk_d or rsk_u
+    param : List
+        List of channel names exported, as given to procRSK
+    profile_nb : int
+        Profile number identified in procRSK
+
+    Returns
+    -------
+    data : numpy structured array
+        rows of the profile with the timestamp and the param channels
+    channel_names : List
+        channel names, in the order of RSK2CSV
+    channel_units : List
+        channel units, in the same order
+
+    '''
+    channel_names, channel_units = rsk_cast.getchannelnamesandunits(param)
+
+    # same rows as RSK2CSV with its default direction "both"
+    down = rsk_cast.getprofilesindices(profile_nb, "down")
+    up = rsk_cast.getprofilesindices(profile_nb, "up")
+    indices = np.concatenate(
+        [np.asarray(i, dtype=np.intp) for pair in zip(down, up) for i in pair]
+    )
+
+    data = rsk_cast.data[["timestamp"] + channel_names][indices]
+
+    return data, channel_names, channel_units
+
+
+def toSomlitDB_from_array(data, channel_names, channel_units, site_id, output_file):
+    '''
+    Same as toSomlitDB but the binned data are given in memory instead of
+    a RBR csv file, no text file is written nor parsed.
+    The frame built is the one toSomlitDB reads from the RBR csv
+
+    Parameters
+    ----------
+    data : numpy structured array
+        binned data with a timestamp field and the channels, cf. rsk_cast_to_array
+    channel_names : List
+        channel names to use in data
+    channel_units : List
+        channel units, in the same order, used to map the SOMLIT columns
+    site_id : int
+        Somlit site id where RBR data have been collected: cf sites.py
+    output_file : str
+        file name for the somlit file to output
+
+    Returns
+    -------
+    None.
+
+    '''
+    # same column names as in the header of the RBR csv file
+    df = pd.DataFrame(
+        {
+            f"{name}({unit})": data[name]
+            for name, unit in zip(channel_names, channel_units)
+        },
+        index=pd.DatetimeIndex(
+            data["timestamp"], name="timestamp(yyyy-mm-ddTHH:MM:ss.FFF)"
+        ),
+    )
+
+    # remove line with nan
+    df = df.dropna()
+
+    somlit_frame_to_file(df, site_id, output_file)
+
+
+# %% somlit_frame_to_file
+
+
+def somlit_frame_to_file(df, site_id, output_file):
+    '''
+    Function to format a frame of RBR processed data to the Somlit database
+    file format and to write it, shared by toSomlitDB and toSomlitDB_from_array
+
+    Parameters
+    ----------
+    df : DataFrame
+        RBR processed data indexed by timestamp, columns named channel(units)
+        as in the RBR csv files
+    site_id : int
+        Somlit site id where RBR data have been collected: cf sites.py
+    output_file : str
+        file name for the somlit file to output
+
+    Returns
+    -------
+    None.
+
+    '''
     # Assume df already has datetime index
 
     # 1. Extract date and time from index
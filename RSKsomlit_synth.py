@@ -0,0 +1,235 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Script file name: RSKsomlit_synth.py
+Author: Etienne Poirier, IRD, Plouzané
+Date created: 2026-10-18
+Last update: 2026-10-18
+Description: synthetic RBR Maestro-like RSK files, to test and benchmark the
+processing without field files. Each day holds a recording window with
+SOMLIT-like profiles (surface soak, descent, ascent) and swell-induced
+false casts at the surface, with the channels of the Maestro used at
+SOMLIT.
+
+usage example:
+    python RSKsomlit_synth.py synth.rsk --days 7 --hz 8 --profiles 1
+"""
+import argparse
+import os
+
+import numpy as np
+
+# channel name, units, name in the RSK data table
+CHANNELS = [
+    ("conductivity", "mS/cm", "conductivity"),
+    ("temperature", "°C", "temperature"),
+    ("pressure", "dbar", "pressure"),
+    ("temperature1", "°C", "temperature1"),
+    ("dissolved_o2_concentration", "µmol/L", "dissolved O2 concentration"),
+    ("par", "µMol/m²/s", "PAR"),
+    ("chlorophyll-a", "µg/L", "chlorophyll-a"),
+    ("ph", "pH", "pH"),
+    ("fdom", "ppb", "FDOM"),
+    ("turbidity", "NTU", "turbidity"),
+]
+
+PATM = 10.1325  # dbar
+SPEED = 0.5  # dbar/s, descent and ascent speed
+SOAK = 60  # s, surface soak before each profile
+FALSE_CAST = 20  # s, duration of a swell false cast
+
+
+# %% synthetic_sea_pressure
+def synthetic_sea_pressure(t, hours, profiles, false_casts, max_depth, rng):
+    """
+    Sea pressure of one recording window, piecewise linear between knots:
+    the Maestro is in the air between the profiles, each profile is a soak
+    at the surface where the swell makes false casts, a descent to
+    max_depth and an ascent.
+
+    Parameters
+    ----------
+    t : numpy array
+        time of the samples in s from the start of the window
+    hours : float
+        duration of the window (h)
+    profiles : int
+        number of profiles in the window
+    false_casts : int
+        number of swell false casts in the window, spread over the soaks
+    max_depth : float
+        depth of the profiles (dbar)
+    rng : numpy Generator
+        random generator for the noise
+
+    Returns
+    -------
+    sea_pressure : numpy array
+        sea pressure of the samples (dbar)
+
+    """
+    duration = hours * 3600
+    slot = duration / profiles
+    casts_per_soak = np.diff(np.linspace(0, false_casts, profiles + 1).round()).astype(int)
+    travel = max_depth / SPEED
+
+    knot_t, knot_p = [0.0], [0.0]
+    for i in range(profiles):
+        soak = SOAK + casts_per_soak[i] * FALSE_CAST * 1.5
+        length = soak + 2 * travel + 10
+        if length > slot:
+            raise ValueError(f"{profiles} profiles of {max_depth} dbar do not fit in {hours} h")
+        start = i * slot + (slot - length) / 2
+        # in the air, then in the water at the surface
+        knot_t += [start, start + 1]
+        knot_p += [0.0, 0.3]
+        # swell false casts during the soak
+        for j in range(casts_per_soak[i]):
+            c = start + SOAK + j * FALSE_CAST * 1.5
+            knot_t += [c, c + FALSE_CAST / 2, c + FALSE_CAST]
+            knot_p += [0.3, 0.3 + rng.uniform(0.4, 1.0), 0.3]
+        # descent, short stop at the bottom, ascent, out of the water
+        bottom = start + soak + travel
+        knot_t += [start + soak, bottom, bottom + 10, bottom + 10 + travel,
+                   bottom + 11 + travel]
+        knot_p += [0.3, max_depth, max_depth, 0.3, 0.0]
+    knot_t.append(duration)
+    knot_p.append(0.0)
+
+    sea_pressure = np.interp(t, knot_t, knot_p)
+    sea_pressure += rng.normal(0, 0.005, t.size)
+    return sea_pressure
+
+
+# %% synthetic_data
+def synthetic_data(start_day="2025-06-02", days=1, hz=8, hours=1.0,
+                   profiles=1, false_casts=2, max_depth=10.0, seed=0):
+    """
+    Samples of the synthetic deployment as a structured array with the
+    dtype of RSK.data, one recording window per day starting at 08:00.
+
+    Parameters
+    ----------
+    start_day : str
+        first day, YYYY-MM-DD
+    days : int
+        number of days
+    hz : float
+        sampling rate (Hz)
+    hours : float
+        duration of the recording window of each day (h), up to 24
+    profiles : int
+        profiles per day
+    false_casts : int
+        swell false casts per day
+    max_depth : float
+        depth of the profiles (dbar)
+    seed : int
+        seed of the random generator, same seed same data
+
+    Returns
+    -------
+    data : numpy structured array
+        timestamp and the channels of CHANNELS
+
+    """
+    rng = np.random.default_rng(seed)
+    period = int(round(1000 / hz))  # ms
+    n_day = int(hours * 3600 * 1000) // period
+    n = n_day * days
+    dtype = [("timestamp", "datetime64[ms]")] + [(c[0], "float64") for c in CHANNELS]
+    data = np.empty(n, dtype=dtype)
+
+    day0 = np.datetime64(start_day, "D").astype("datetime64[ms]")
+    window = np.arange(n_day, dtype=np.int64) * period
+    # the 24 h windows start at midnight so that they stay within the day
+    offset = np.timedelta64(0 if hours >= 24 else 8, "h")
+    for d in range(days):
+        rows = slice(d * n_day, (d + 1) * n_day)
+        start = day0 + np.timedelta64(d, "D") + offset
+        data["timestamp"][rows] = start + window.astype("timedelta64[ms]")
+        data["pressure"][rows] = PATM + synthetic_sea_pressure(
+            window / 1000, hours, profiles, false_casts, max_depth, rng
+        )
+
+    sp = data["pressure"] - PATM
+    in_water = sp > 0.15
+    data["temperature"] = 15 - 0.3 * sp + rng.normal(0, 0.001, n)
+    # the DO temperature sensor lags behind
+    data["temperature1"] = np.concatenate(
+        [np.full(int(hz), data["temperature"][0]), data["temperature"][:-int(hz)]]
+    )[:n] + 0.01
+    data["conductivity"] = np.where(in_water, 42 + 0.05 * sp, 0.01) + rng.normal(0, 0.002, n)
+    data["dissolved_o2_concentration"] = 250 - sp + rng.normal(0, 0.1, n)
+    data["par"] = np.where(in_water, 1000 * np.exp(-sp / 3), 1500) + rng.normal(0, 1, n)
+    data["chlorophyll-a"] = 1 + 0.1 * sp + rng.normal(0, 0.01, n)
+    data["ph"] = 8.1 - 0.005 * sp + rng.normal(0, 0.001, n)
+    data["fdom"] = 2 + 0.05 * sp + rng.normal(0, 0.01, n)
+    data["turbidity"] = np.where(in_water, 0.5 + 0.02 * sp, 0.1) + rng.normal(0, 0.01, n)
+    return data
+
+
+# %% synthetic_rsk
+def synthetic_rsk(output_file, **kwargs):
+    """
+    Writes a synthetic RSK file, cf. synthetic_data for the arguments.
+
+    Parameters
+    ----------
+    output_file : str
+        path of the .rsk file to write
+
+    Returns
+    -------
+    output_file : str
+        path of the file written
+
+    """
+    import pyrsktools as pyrsk
+    from dataclasses import replace
+    from pyrsktools.datatypes import Channel, ContinuousInfo
+
+    data = synthetic_data(**kwargs)
+    period = int(round(1000 / kwargs.get("hz", 8)))
+
+    # a two rows instance for the metadata, then the data put in place
+    rsk = pyrsk.RSK.create(
+        timestamps=data["timestamp"][:2],
+        values=[list(row)[1:] for row in data[:2]],
+        channels=[c[0] for c in CHANNELS],
+        units=[c[1] for c in CHANNELS],
+        filename=os.path.basename(output_file),
+        model="RBRmaestro³",
+    )
+    rsk.channels = [
+        Channel(channelID=i + 1, shortName=name, longName=name, units=units,
+                unitsPlainText=units, _dbName=db_name)
+        for i, (name, units, db_name) in enumerate(CHANNELS)
+    ]
+    rsk.data = data
+    rsk.epoch = replace(rsk.epoch, endTime=data["timestamp"][-1])
+    rsk.scheduleInfo = ContinuousInfo(scheduleID=1, continuousID=1, samplingPeriod=period)
+
+    output_dir = os.path.dirname(os.path.abspath(output_file))
+    written = os.path.join(output_dir, rsk.RSK2RSK(outputDir=output_dir))
+    os.replace(written, output_file)
+    return output_file
+
+
+# %% main
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Writes a synthetic Maestro-like RSK file.")
+    parser.add_argument("output_file")
+    parser.add_argument("--start-day", default="2025-06-02", help="first day, default 2025-06-02")
+    parser.add_argument("--days", type=int, default=1, help="number of days, default 1")
+    parser.add_argument("--hz", type=float, default=8, help="sampling rate, default 8 Hz")
+    parser.add_argument("--hours", type=float, default=1.0,
+                        help="recording window of each day (h), default 1")
+    parser.add_argument("--profiles", type=int, default=1, help="profiles per day, default 1")
+    parser.add_argument("--false-casts", type=int, default=2,
+                        help="swell false casts per day, default 2")
+    parser.add_argument("--max-depth", type=float, default=10.0,
+                        help="depth of the profiles (dbar), default 10")
+    parser.add_argument("--seed", type=int, default=0)
+    args = vars(parser.parse_args())
+    print(synthetic_rsk(args.pop("output_file"), **args))
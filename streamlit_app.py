@@ -8,7 +8,7 @@ Created on Mon Jan 12 14:53:22 2026
 Script file name: streamlit_app.py
 Author: Etienne Poirier, IRD, Plouzané
 Date created: 2026-01-12
-Last update: 2026-01-13
+Last update: 2026-10-18
 Description: code for streamlit page https://online-somlit-rbr-proc.streamlit.app/
 """
 
@@ -17,7 +17,13 @@ import tempfile
 import zipfile
 import os
 import base64
+import io
 import shutil
+import hashlib
+import json
+import threading
+import weakref
+from collections import OrderedDict
 
 import RSKsomlit_proc as rsksproc
 from sites import sites
@@ -42,11 +48,288 @@ def deduplicate_by_filename(uploaded_files):
     return unique_files, discarded
 
 
+# --- Result cache ---
+# channels processed by the page
+PARAM = ['conductivity',
+         'temperature',
+         #'pressure',
+         'temperature1',
+         'dissolved_o2_concentration',
+         'par',
+         'ph',
+         'chlorophyll-a',
+         'fdom',
+         'turbidity',
+         # 'sea_pressure',
+         'depth',
+         'salinity',
+         # 'speed_of_sound',
+         # 'specific_conductivity',
+         # 'dissolved_o2_saturation',
+         # 'velocity',
+         'density_anomaly',
+         'dissolved_o2_compensated',
+         'temperature1_compensated'
+         ]
+
+# number of processed results kept, least recently used dropped
+RESULT_CACHE_SIZE = 8
+# chunk size used to copy the uploads to disk
+UPLOAD_CHUNK_SIZE = 1024 * 1024
+# outputs already compressed, stored as is in the zip
+STORED_EXTENSIONS = (".png", ".jpg", ".zip")
+
+
+def remove_file(path):
+    if os.path.exists(path):
+        os.remove(path)
+
+
+class ResultZip:
+    """
+    Zip of the outputs of one processing run, in its own file of folder so
+    that two runs never write the same zip. The file is removed once nothing
+    refers to it any more: neither the cache nor a session still showing
+    its download button.
+    """
+
+    def __init__(self, folder):
+        fd, self.path = tempfile.mkstemp(suffix=".zip", dir=folder)
+        os.close(fd)
+        weakref.finalize(self, remove_file, self.path)
+
+    def read(self):
+        # called by the download button on click, the file is closed
+        # before the bytes are served
+        with open(self.path, "rb") as f:
+            return f.read()
+
+
+class ResultCache:
+    """
+    Bounded LRU cache of processing results shared by all the sessions of
+    the app, keyed by upload content and processing parameters. The zip of
+    each result is kept on disk in folder, cf. ResultZip, dropping a result
+    does not remove a zip still served to a session.
+    """
+
+    def __init__(self, maxsize=RESULT_CACHE_SIZE):
+        self.maxsize = maxsize
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+        self.folder = tempfile.mkdtemp(prefix="somlit_results_")
+
+    def new_zip(self):
+        return ResultZip(self.folder)
+
+    def get(self, key):
+        with self.lock:
+            if key not in self.entries:
+                return None
+            self.entries.move_to_end(key)
+            return self.entries[key]
+
+    def put(self, key, result):
+        with self.lock:
+            self.entries[key] = result
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.maxsize:
+                # the zip goes with its last reference, cf. ResultZip
+                self.entries.popitem(last=False)
+
+
+@st.cache_resource
+def get_result_cache():
+    # one cache per server process, survives reruns and sessions
+    return ResultCache()
+
+
+def upload_digest(f):
+    """
+    Content hash of an uploaded file, computed once per upload and kept in
+    the session so reruns do not hash the file again.
+    """
+    digests = st.session_state.setdefault("upload_digests", {})
+    if f.file_id not in digests:
+        f.seek(0)
+        digests[f.file_id] = hashlib.file_digest(f, "sha256").hexdigest()
+        f.seek(0)
+    return digests[f.file_id]
+
+
+def result_cache_key(uploaded_files, proc_params):
+    """
+    Cache key of a processing: file names and content hashes of the uploads
+    and the parameters given to the processing.
+    """
+    key = {
+        "files": sorted((f.name, upload_digest(f)) for f in uploaded_files),
+        "params": proc_params,
+    }
+    return hashlib.sha256(json.dumps(key, sort_keys=True).encode()).hexdigest()
+
+
+def zip_tree(zipf, folder, base, added, empty_dirs=True):
+    """
+    Adds the files of folder to the open zipf that are not in added yet,
+    with their path relative to base so the folder structure is preserved.
+    Files are streamed from disk one by one, the figures are stored without
+    compression. added is updated with the names written. With empty_dirs
+    the empty directories are also written.
+    """
+    # Walk recursively through folder
+    for root, dirs, files in os.walk(folder):
+        for file in files:
+            full_path = os.path.join(root, file)
+            arcname = os.path.relpath(full_path, base)
+            if arcname in added:
+                continue
+            if file.lower().endswith(STORED_EXTENSIONS):
+                # already compressed, deflating again only costs time
+                zipf.write(full_path, arcname=arcname,
+                           compress_type=zipfile.ZIP_STORED)
+            else:
+                zipf.write(full_path, arcname=arcname)
+            added.add(arcname)
+        if not empty_dirs:
+            continue
+        for dir_ in dirs:
+            dir_path = os.path.join(root, dir_)
+            if not os.listdir(dir_path):  # folder is empty
+                arcname = os.path.relpath(dir_path, base) + '/'
+                if arcname not in added:
+                    zipf.writestr(arcname, '')
+                    added.add(arcname)
+
+
+def process_uploads(uploaded_files, proc_params, result_zip):
+    """
+    Runs the processing of the uploaded files in a temporary folder and
+    zips the outputs in result_zip, a ResultZip. The zip is built as the
+    files are processed: the output folder of each file is added as soon
+    as it is done, the rest of proc_data once the processing ends.
+    Returns a dictionnary with the listing of proc_data, the zip, the
+    summary of the stage profiling when asked, the errors of the files that
+    failed and complete, True when every file succeeded with outputs.
+    """
+    with tempfile.TemporaryDirectory() as tmpdir:
+
+        # create proc_data folder
+        proc_data_dir = os.path.join(tmpdir, "proc_data")
+        # Delete previous content if it exists
+        if os.path.exists(proc_data_dir):
+            shutil.rmtree(proc_data_dir)
+
+        # Recreate empty folder
+        os.makedirs(proc_data_dir, exist_ok=True)
+
+        # Save all uploaded files to tmpdir
+        tmp_paths = []
+        for f in uploaded_files:
+            path = os.path.join(tmpdir, f.name)
+            f.seek(0)
+            with open(path, "wb") as out:
+                # copied by chunks, no second copy of the upload in memory
+                shutil.copyfileobj(f, out, UPLOAD_CHUNK_SIZE)
+            tmp_paths.append(path)
+
+        # %%
+        # Smart processing based on number of files selected
+        # Starting with one file first
+        if len(uploaded_files) == 1: # if only one file selected
+            # Call your normal processing function here
+            files_to_process = rsksproc.export_profiles2rsk(
+                tmp_paths[0], proc_data_dir
+            )
+        # case with several files given by user
+        else:
+            # Call the special multi-file processing function here
+            # first step processing, scanning for multiple days
+            files_to_process = rsksproc.scan_rsk(tmpdir)
+
+        # the zip export, written directly where it is kept
+        with zipfile.ZipFile(result_zip.path, "w", zipfile.ZIP_DEFLATED) as zipf:
+            added = set()
+
+            def zip_outputs(done, total, result):
+                # outputs of a file complete once it is done, its folder is
+                # zipped while the next files are processed
+                if result["output_folder"] is not None:
+                    zip_tree(zipf, result["output_folder"], tmpdir, added,
+                             empty_dirs=False)
+
+            # second step processing of the _YYYYMMDD.rsk files created above
+            results = rsksproc.process_rsk_folder(
+                path_in=proc_data_dir,
+                list_of_rsk=files_to_process,
+                param=PARAM,
+                progress=zip_outputs,
+                **proc_params
+            )
+            listing = os.listdir(proc_data_dir)
+            reports = [r["profile"] for r in results if r.get("profile")]
+
+            # the rest of proc_data: split files, manifest, empty folders
+            zip_tree(zipf, proc_data_dir, tmpdir, added)
+
+        errors = [
+            f"{os.path.basename(r['file'])}: {r['error']}"
+            for r in results if not r["success"]
+        ]
+        complete = bool(results) and not errors and all(
+            any(files for _, _, files in os.walk(r["output_folder"]))
+            for r in results
+        )
+
+    return {
+        "listing": listing,
+        "zip": result_zip,
+        "errors": errors,
+        "complete": complete,
+        "profile": rsksproc.summarize_profiles(reports) if reports else None,
+    }
+
+
+# --- Static images ---
+# widths the images are served at, background is shown as cover and the
+# logos at 160 px (twice for high density screens)
+BG_MAX_WIDTH = 1920
+LOGO_MAX_WIDTH = 320
+
+
+# function to deal with the images, encoded once per process as the page
+# script runs again on each widget interaction
+@st.cache_resource
+def encode_image(path, max_width=None):
+    """
+    Base64 of an image file. With max_width, a wider image is first
+    downscaled to max_width, keeping its format. An image already narrow
+    enough is served as is, not encoded again.
+    """
+    with open(path, "rb") as f:
+        original = f.read()
+    if max_width is None:
+        return base64.b64encode(original).decode("utf-8")
+
+    from PIL import Image  # pillow is installed with streamlit
+
+    with Image.open(io.BytesIO(original)) as img:
+        if img.width <= max_width:
+            return base64.b64encode(original).decode("utf-8")
+        fmt = img.format
+        img.thumbnail((max_width, img.height))
+        buffer = io.BytesIO()
+        if fmt == "JPEG":
+            img.save(buffer, format=fmt, quality=85, optimize=True)
+        else:
+            img.save(buffer, format=fmt, optimize=True)
+    return base64.b64encode(buffer.getvalue()).decode("utf-8")
+
+
 # --- Background image ---
 def set_bg_local(image_path):
     full_path = os.path.join(os.path.dirname(__file__), image_path)
-    with open(full_path, "rb") as f:
-        encoded = base64.b64encode(f.read()).decode()
+    encoded = encode_image(full_path, BG_MAX_WIDTH)
 
     st.markdown(
         f"""
@@ -112,13 +395,8 @@ IMG_DIR = os.path.join(BASE_DIR, "image")
 LOGO_1 = os.path.join(IMG_DIR, "logo_iuem_rz.jpg")
 LOGO_2 = os.path.join(IMG_DIR, "logo_somlit.png")
 
-# function to deal with the logo
-def encode_image(path):
-    with open(path, "rb") as f:
-        return base64.b64encode(f.read()).decode("utf-8")
-
-encoded_logo_1 = encode_image(LOGO_1)
-encoded_logo_2 = encode_image(LOGO_2)
+encoded_logo_1 = encode_image(LOGO_1, LOGO_MAX_WIDTH)
+encoded_logo_2 = encode_image(LOGO_2, LOGO_MAX_WIDTH)
 
 
 st.markdown(
@@ -216,6 +494,18 @@ if uploaded_files:
         step=0.10,
         format="%.2f"
     )
+
+    # every valid profile of each file instead of the deepest one only
+    all_profiles = st.checkbox(
+        "Process every profile of each file (outputs labelled by profile number)",
+        value=False
+    )
+
+    # opt-in stage profiling, slows the processing down
+    profile_stages = st.checkbox(
+        "Profile processing stages (time and memory, slower)",
+        value=False
+    )
     # process button
     process = st.button(
         "Process File(s)",
@@ -224,162 +514,80 @@ if uploaded_files:
 
 # %%
 # ---- PROCESSING CODE for single file then multiple files----
-    if process:
+    if len(uploaded_files) == 1:
+        proc_params = {
+            "site_id": site_id,
+            "patm": atmospheric_pressure,
+            "p_tresh": pressure_threshold,
+            "c_tresh": conductivity_threshold,
+            "profile": profile_stages,
+            "profiles": "all" if all_profiles else "best",
+        }
+    else:
+        proc_params = {
+            "site_id": 5,
+            "patm": 10.1325,
+            "p_tresh": 0.4, #0.4 for multiple rsk // 0.05 for simple profile
+            "c_tresh": 5, #5 for multiple rsk // 0.5 for simple profile
+            "profile": profile_stages,
+            "profiles": "all" if all_profiles else "best",
+        }
+
+    # same uploads and parameters already processed: served from the cache,
+    # also on the reruns following the click, e.g. the download
+    cache = get_result_cache()
+    cache_key = result_cache_key(uploaded_files, proc_params)
+    result = cache.get(cache_key)
+
+    if process or result is not None:
         try:
-            with st.spinner("Processing RSK/RBR file..."):
-                with tempfile.TemporaryDirectory() as tmpdir:
-                    
-                    # create proc_data folder
-                    proc_data_dir = os.path.join(tmpdir, "proc_data")
-                    # Delete previous content if it exists
-                    if os.path.exists(proc_data_dir):
-                        shutil.rmtree(proc_data_dir)
-
-                    # Recreate empty folder
-                    os.makedirs(proc_data_dir, exist_ok=True)
-                    
-                    # Save all uploaded files to tmpdir
-                    tmp_paths = []
-                    for f in uploaded_files:
-                        path = os.path.join(tmpdir, f.name)
-                        with open(path, "wb") as out:
-                            out.write(f.read())
-                        tmp_paths.append(path)
-                                        
-                    # %%
-                    # Smart processing based on number of files selected
-                    # Starting with one file first
-                    if len(uploaded_files) == 1: # if only one file selected
-                        st.write("Single file selected. Using standard processing...")
-                        # Call your normal processing function here
-                        files_to_process = rsksproc.export_profiles2rsk(
-                            tmp_paths[0], proc_data_dir
-                        )
-    
-                        rsksproc.process_rsk_folder(
-                            path_in=proc_data_dir,
-                            list_of_rsk=files_to_process,
-                            site_id=site_id,
-                            patm=atmospheric_pressure,
-                            p_tresh=pressure_threshold,
-                            c_tresh=conductivity_threshold,
-                            param=['conductivity',
-                                    'temperature',
-                                    #'pressure',
-                                    'temperature1',
-                                    'dissolved_o2_concentration',
-                                    'par',
-                                    'ph',
-                                    'chlorophyll-a',
-                                    'fdom',
-                                    'turbidity',
-                                    # 'sea_pressure',
-                                    'depth',
-                                    'salinity',
-                                    # 'speed_of_sound',
-                                    # 'specific_conductivity',
-                                    # 'dissolved_o2_saturation',
-                                    # 'velocity',
-                                    'density_anomaly',
-                                    'dissolved_o2_compensated',
-                                    'temperature1_compensated'
-                                    ] )
-                        # writing the identified days with somlit profile
-                        st.write("RBR profiles identified start-stop datetimes (/outputs contains the figures):", os.listdir(proc_data_dir))
-                        # writing the ouptput                                                                                                                                                                                                                                                                                                                                                                                                                                                                
-                        zip_path = os.path.join(tmpdir, "processed_output.zip")
-                        with zipfile.ZipFile(zip_path, "w", zipfile.ZIP_DEFLATED) as zipf:
-                            # Walk recursively through proc_data
-                            for root, dirs, files in os.walk(proc_data_dir):
-                                for file in files:
-                                    full_path = os.path.join(root, file)
-                                    # Compute relative path for the zip so folder structure is preserved
-                                    arcname = os.path.relpath(full_path, os.path.dirname(proc_data_dir))
-                                    zipf.write(full_path, arcname=arcname)
-                                    # Optional: include empty directories
-                                for dir_ in dirs:
-                                    dir_path = os.path.join(root, dir_)
-                                    if not os.listdir(dir_path):  # folder is empty
-                                        arcname = os.path.relpath(dir_path, os.path.dirname(proc_data_dir))
-                                        zipf.writestr(arcname + '/', '')
-    
-                        with open(zip_path, "rb") as f:
-                            st.download_button(
-                                "Download Processed Output",
-                                data=f,
-                                file_name="processed_output.zip",
-                                mime="application/zip"
-                            )
-    
-                        st.success("Processing complete!")
-                        # more than one file selected
-                        
-                        # case with several files given by user
-                        # %%
-                    else:
-                        st.write(f"{len(uploaded_files)} files selected. Using multi-file processing...")
-                        # Call the special multi-file processing function here
-                        
-                        # first step processing, scanning for multiple days
-                        files_to_process = rsksproc.scan_rsk(tmpdir)
-                        
-                        # second step processing of _YYYYMMDD.rsk files created above
-                        rsksproc.process_rsk_folder(
-                            path_in = proc_data_dir,
-                            list_of_rsk = files_to_process,
-                            site_id =5,
-                            patm = 10.1325,
-                            p_tresh = 0.4, #0.4 for multiple rsk // 0.05 for simple profile
-                            c_tresh = 5, #5 for multiple rsk // 0.5 for simple profile
-                            param=['conductivity',
-                                    'temperature',
-                                    #'pressure',
-                                    'temperature1',
-                                    'dissolved_o2_concentration',
-                                    'par',
-                                    'ph',
-                                    'chlorophyll-a',
-                                    'fdom',
-                                    'turbidity',
-                                    # 'sea_pressure',
-                                    'depth',
-                                    'salinity',
-                                    # 'speed_of_sound',
-                                    # 'specific_conductivity',
-                                    # 'dissolved_o2_saturation',
-                                    # 'velocity',
-                                    'density_anomaly',
-                                    'dissolved_o2_compensated',
-                                    'temperature1_compensated'
-                                    ] )
-                        st.write("SOMLIT days identified _YYYYMMDD.rsk (/outputs contains profiles data and figures):", os.listdir(proc_data_dir))
-                        # preparing the zip export
-                        zip_path = os.path.join(tmpdir, "processed_output.zip")
-                        with zipfile.ZipFile(zip_path, "w", zipfile.ZIP_DEFLATED) as zipf:
-                            # Walk recursively through proc_data
-                            for root, dirs, files in os.walk(proc_data_dir):
-                                for file in files:
-                                    full_path = os.path.join(root, file)
-                                    # Compute relative path for the zip so folder structure is preserved
-                                    arcname = os.path.relpath(full_path, os.path.dirname(proc_data_dir))
-                                    zipf.write(full_path, arcname=arcname)
-                                    # Optional: include empty directories
-                                for dir_ in dirs:
-                                    dir_path = os.path.join(root, dir_)
-                                    if not os.listdir(dir_path):  # folder is empty
-                                        arcname = os.path.relpath(dir_path, os.path.dirname(proc_data_dir))
-                                        zipf.writestr(arcname + '/', '')
-    
-                        with open(zip_path, "rb") as f:
-                            st.download_button(
-                                "Download Processed Output",
-                                data=f,
-                                file_name="processed_output.zip",
-                                mime="application/zip"
-                            )
-    
-                        st.success("Processing complete!")
-                        
+            if len(uploaded_files) == 1:
+                st.write("Single file selected. Using standard processing...")
+            else:
+                st.write(f"{len(uploaded_files)} files selected. Using multi-file processing...")
+
+            if result is None:
+                with st.spinner("Processing RSK/RBR file..."):
+                    result = process_uploads(
+                        uploaded_files, proc_params, cache.new_zip()
+                    )
+                # only complete runs are served again, a failed one is
+                # retried on the next click
+                if result["complete"]:
+                    cache.put(cache_key, result)
+            else:
+                st.info("Same file(s) and parameters already processed, using the previous results.")
+
+            if len(uploaded_files) == 1:
+                # writing the identified days with somlit profile
+                st.write("RBR profiles identified start-stop datetimes (/outputs contains the figures):", result["listing"])
+            else:
+                st.write("SOMLIT days identified _YYYYMMDD.rsk (/outputs contains profiles data and figures):", result["listing"])
+
+            if result["profile"] is not None:
+                # stages sorted by time, the reports are in each output folder
+                st.subheader("Processing profile")
+                st.write(f"Stages summed over the files, {rsksproc.PROFILE_NAME} in each output folder has the details.")
+                st.dataframe(result["profile"], hide_index=True)
+
+            if result["errors"]:
+                st.error("Processing failed for:\n- " + "\n- ".join(result["errors"]))
+            elif not result["complete"]:
+                st.error("No output produced, check the file(s) and parameters.")
+
+            # the session keeps the zip it shows, even if the cache drops it
+            st.session_state["result_zip"] = result["zip"]
+            st.download_button(
+                "Download Processed Output",
+                # read from disk only when the button is clicked
+                data=result["zip"].read,
+                file_name="processed_output.zip",
+                mime="application/zip"
+            )
+
+            if result["complete"]:
+                st.success("Processing complete!")
+
         except Exception as e:
             st.error(f"Error processing file: {e}")
 # %%
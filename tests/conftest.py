@@ -0,0 +1,11 @@
+# -*- coding: utf-8 -*-
+"""
+The modules are flat scripts at the root of the repository, the tests import
+them from there.
+"""
+import os
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ROOT not in sys.path:
+    sys.path.insert(0, ROOT)
@@ -0,0 +1,89 @@
+# -*- coding: utf-8 -*-
+"""
+binaverage_casts must give the rows of RSK.binaverage of pyrsktools, bit for
+bit, for the binning of procRSK.
+"""
+import numpy as np
+import pytest
+
+pyrsk = pytest.importorskip("pyrsktools")
+
+import RSKsomlit_proc as rsksproc
+import sites
+from RSKsomlit_synth import PATM, synthetic_rsk
+
+BIN_SIZE = 0.25
+
+
+@pytest.fixture(scope="module")
+def rsk_file(tmp_path_factory):
+    # two profiles and swell false casts
+    path = tmp_path_factory.mktemp("binaverage") / "synth.rsk"
+    return synthetic_rsk(str(path), hours=1, profiles=2, false_casts=4)
+
+
+def processed_rsk(rsk_file):
+    """
+    The rsk of procRSK as it is binned, the steps changing the binned
+    channels only
+    """
+    rsk = pyrsk.RSK(rsk_file)
+    rsk.open()
+    rsk.readdata()
+    rsk.deriveseapressure(PATM)
+    rsk.computeprofiles(0.4, 5)
+    rsk.derivedepth(sites.sites[5]["latitude"], seawaterLibrary="TEOS-10")
+    rsk.derivevelocity()
+    rsk.derivesalinity()
+    rsk.removeloops(direction="down", threshold=0.05)
+    return rsk
+
+
+def boundaries(rsk):
+    # the boundaries of procRSK
+    start_depth = 0.75
+    start_d = start_depth - BIN_SIZE / 2
+    end_d = int(np.nanmax(rsk.data["depth"]) // BIN_SIZE) * BIN_SIZE
+    return {
+        "down": [start_d, end_d],
+        "up": [start_depth, round(np.nanmax(rsk.data["depth"])) + start_d],
+    }
+
+
+def assert_same_as_pyrsktools(rsk, profiles):
+    binned = rsksproc.binaverage_casts(rsk, profiles, BIN_SIZE, boundaries(rsk))
+    for direction, boundary in boundaries(rsk).items():
+        expected = rsk.copy()
+        expected.binaverage(profiles=profiles, binBy="depth", binSize=BIN_SIZE,
+                            boundary=boundary, direction=direction)
+        data, log = binned[direction]
+        assert data.dtype == expected.data.dtype
+        assert data.shape == expected.data.shape
+        for name in data.dtype.names:
+            np.testing.assert_array_equal(
+                data[name], expected.data[name], err_msg=f"{direction} {name}"
+            )
+        assert log == list(expected.logs.values())[-1]
+
+
+@pytest.mark.parametrize("profiles", ["best", "all"])
+def test_binaverage_casts_matches_pyrsktools(rsk_file, profiles):
+    rsk = processed_rsk(rsk_file)
+    try:
+        profile_nb = rsksproc.select_profiles(rsk, profiles)
+        if profiles == "all":
+            assert len(profile_nb) == 2
+        assert_same_as_pyrsktools(rsk, profile_nb)
+    finally:
+        rsk.close()
+
+
+def test_binaverage_casts_matches_pyrsktools_with_nans(rsk_file):
+    rsk = processed_rsk(rsk_file)
+    try:
+        rng = np.random.default_rng(1)
+        for name in ("temperature", "salinity", "conductivity"):
+            rsk.data[name][rng.random(rsk.data.size) < 0.05] = np.nan
+        assert_same_as_pyrsktools(rsk, rsksproc.select_profiles(rsk, "all"))
+    finally:
+        rsk.close()
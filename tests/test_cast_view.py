@@ -0,0 +1,46 @@
+# -*- coding: utf-8 -*-
+"""
+cast_view shares the data of its parent read-only, the parent cannot be
+changed through a view.
+"""
+import numpy as np
+import pytest
+
+pyrsk = pytest.importorskip("pyrsktools")
+
+import RSKsomlit_proc as rsksproc
+from RSKsomlit_synth import synthetic_rsk
+
+
+@pytest.fixture(scope="module")
+def rsk(tmp_path_factory):
+    path = tmp_path_factory.mktemp("cast_view") / "synth.rsk"
+    rsk = pyrsk.RSK(synthetic_rsk(str(path), hours=0.25))
+    rsk.open()
+    rsk.readdata()
+    yield rsk
+    rsk.close()
+
+
+def test_view_shares_the_rows_read_only(rsk):
+    before = rsk.data.copy()
+    view = rsksproc.cast_view(rsk, rows=slice(10, 20))
+
+    assert np.shares_memory(view.data, rsk.data)
+    np.testing.assert_array_equal(view.data, rsk.data[10:20])
+    with pytest.raises(ValueError):
+        view.data["temperature"][0] = 0.0
+    np.testing.assert_array_equal(rsk.data, before)
+    assert rsk.data.flags.writeable
+
+
+def test_view_lists_are_its_own(rsk):
+    logs = dict(rsk.logs)
+    view = rsksproc.cast_view(rsk, data=rsk.data[:5].copy())
+    view.appendlog("view only")
+    view.data["temperature"] = 0.0
+
+    assert rsk.logs == logs
+    assert len(view.logs) == len(logs) + 1
+    assert view.channels is not rsk.channels
+    assert not (rsk.data["temperature"][:5] == 0.0).all()
@@ -0,0 +1,88 @@
+# -*- coding: utf-8 -*-
+"""
+rsk_day_inventory counts the days of a file in SQL, it must find the days,
+samples and first/last timestamps that partition_by_day finds on the
+timestamps read by pyrsktools.
+"""
+import sqlite3
+
+import numpy as np
+import pytest
+
+pyrsk = pytest.importorskip("pyrsktools")
+
+import RSKsomlit_proc as rsksproc
+from RSKsomlit_synth import synthetic_rsk
+
+DAY_MS = 86400000
+
+
+def read_timestamps(path):
+    with pyrsk.RSK(path) as rsk:
+        rsk.readdata()
+        return rsk.data["timestamp"].copy()
+
+
+def assert_inventory(inventory, timestamps):
+    days = rsksproc.partition_by_day(timestamps)
+    assert len(inventory) == len(days)
+    for row, (day, index) in zip(inventory.itertuples(), days):
+        stamps = timestamps[index]
+        assert np.datetime64(row.day, "D") == day
+        assert row.samples == len(stamps)
+        assert np.datetime64(row.first, "ms") == stamps[0]
+        assert np.datetime64(row.last, "ms") == stamps[-1]
+
+
+def test_days_across_midnight(tmp_path):
+    # 24 h windows: the samples run on from one day into the next
+    path = synthetic_rsk(str(tmp_path / "midnight.rsk"), days=3, hours=24, hz=1)
+    timestamps = read_timestamps(path)
+    inventory = rsksproc.rsk_day_inventory(path)
+
+    assert_inventory(inventory, timestamps)
+    assert len(inventory) == 3
+    assert (inventory["last"].iloc[:-1].to_numpy() + np.timedelta64(1, "s")
+            == inventory["first"].iloc[1:].to_numpy()).all()
+
+    multiple, dates = rsksproc.has_multiple_days_and_dates(path)
+    assert multiple
+    np.testing.assert_array_equal(dates, [day for day, _ in rsksproc.partition_by_day(timestamps)])
+
+
+def test_single_day(tmp_path):
+    path = synthetic_rsk(str(tmp_path / "single.rsk"), hours=0.25)
+    assert_inventory(rsksproc.rsk_day_inventory(path), read_timestamps(path))
+
+    multiple, dates = rsksproc.has_multiple_days_and_dates(path)
+    assert not multiple
+    assert len(dates) == 1
+
+
+def test_second_schedule_and_out_of_epoch_rows(tmp_path):
+    # readdata reads the first schedule within the epoch, so does the inventory
+    path = synthetic_rsk(str(tmp_path / "schedules.rsk"), days=2, hours=0.5, hz=1)
+    timestamps = read_timestamps(path)
+    first = int(timestamps[0].astype(np.int64))
+    last = int(timestamps[-1].astype(np.int64))
+
+    db = sqlite3.connect(path)
+    with db:
+        db.execute("ALTER TABLE data ADD COLUMN scheduleId INTEGER DEFAULT 1")
+        db.execute("INSERT INTO schedules VALUES (2, 1, 'continuous', NULL)")
+        # a second schedule on the days of the first and on a day of its own
+        db.executemany(
+            "INSERT INTO data (tstamp, scheduleId) VALUES (?, 2)",
+            [(t,) for t in (first + 500, last + 500, last + DAY_MS)],
+        )
+        # first schedule rows outside the epoch
+        db.executemany(
+            "INSERT INTO data (tstamp, scheduleId) VALUES (?, 1)",
+            [(first - DAY_MS,), (last + 2 * DAY_MS,)],
+        )
+        db.execute("UPDATE epochs SET endTime = ?", (last + DAY_MS,))
+    db.close()
+
+    inventory = rsksproc.rsk_day_inventory(path)
+    assert_inventory(inventory, timestamps)
+    assert inventory["samples"].sum() == len(timestamps)
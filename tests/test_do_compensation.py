@@ -0,0 +1,114 @@
+# -*- coding: utf-8 -*-
+"""
+compensate_do and interp_pair must give the values of the former per-sample
+DO compensation of procRSK and of np.interp, bit for bit.
+"""
+import numpy as np
+import pytest
+
+import RSKsomlit_proc as rsksproc
+
+PATM = 10.1325
+
+
+def reference_compensate_do(timestamps, sea_pressure, salinity, temperature,
+                            doxy, doxy_temp, patm):
+    """
+    The DO compensation of procRSK before compensate_do, on 8Hz data
+    """
+    DOXY = doxy
+    DOXY_raw = np.full_like(DOXY, np.nan)
+    DOXY_raw[::8] = DOXY[::8]
+    DOXY = DOXY_raw
+
+    DOXY_TEMP = doxy_temp
+    DOXY_TEMP_raw = np.full_like(DOXY_TEMP, np.nan)
+    DOXY_TEMP_raw[::8] = DOXY_TEMP[::8]
+    DOXY_TEMP = DOXY_TEMP_raw
+
+    c0 = 3.2e-5
+    Fcp = 1 + c0 * (sea_pressure - patm)
+    DOXY = DOXY * Fcp
+
+    S = salinity
+    Ts = np.log((298.15 - temperature) / (273.15 + temperature))
+    Fcs = np.exp(
+        S
+        * (
+            -6.24097e-3
+            - 6.93498e-3 * Ts
+            - 6.90358e-3 * Ts**2
+            - 4.29155e-3 * Ts**3
+        )
+        - 3.11680e-7 * S**2
+    )
+    DOXY = DOXY * Fcs
+
+    time = timestamps
+    time_sec = (time - time[0]) / np.timedelta64(1, "s")
+    dp_dt = np.concatenate(([0], np.diff(sea_pressure) / np.diff(time_sec)))
+    dp_dt[np.abs(dp_dt < 0.1)] = 0.1
+
+    offset = 0.472
+    lag_adv = offset / dp_dt
+
+    mask = ~np.isnan(DOXY)
+    DOXY[mask] = np.interp(time_sec[mask] + lag_adv[mask], time_sec[mask], DOXY[mask])
+    DOXY_TEMP[mask] = np.interp(
+        time_sec[mask] + lag_adv[mask], time_sec[mask], DOXY_TEMP[mask]
+    )
+    return DOXY, DOXY_TEMP
+
+
+def random_cast(seed, n=4000, nan_fraction=0.0):
+    """
+    8Hz samples of a descent and an ascent with noise, NaNs injected in the
+    CTD and DO channels with nan_fraction
+    """
+    rng = np.random.default_rng(seed)
+    timestamps = (np.datetime64("2025-06-02T08:00", "ms")
+                  + (np.arange(n) * 125).astype("timedelta64[ms]"))
+    sea_pressure = PATM + np.concatenate(
+        [np.linspace(0.3, 10, n // 2), np.linspace(10, 0.3, n - n // 2)]
+    ) + rng.normal(0, 0.02, n)
+    temperature = 15 - 0.3 * (sea_pressure - PATM) + rng.normal(0, 0.01, n)
+    salinity = 35 + rng.normal(0, 0.05, n)
+    doxy = 250 + rng.normal(0, 1, n)
+    doxy_temp = temperature + rng.normal(0, 0.01, n)
+    for channel in (sea_pressure, temperature, salinity, doxy, doxy_temp):
+        channel[rng.random(n) < nan_fraction] = np.nan
+    return timestamps, sea_pressure, salinity, temperature, doxy, doxy_temp
+
+
+@pytest.mark.parametrize("seed", range(20))
+@pytest.mark.parametrize("nan_fraction", [0.0, 0.05])
+def test_compensate_do_matches_reference(seed, nan_fraction):
+    cast = random_cast(seed, nan_fraction=nan_fraction)
+    expected = reference_compensate_do(*(c.copy() for c in cast), PATM)
+    # 8Hz, the stride is found from the timestamps
+    result = rsksproc.compensate_do(*cast, PATM)
+    for res, exp in zip(result, expected):
+        np.testing.assert_array_equal(res, exp)
+
+
+def test_compensate_do_keeps_inputs():
+    cast = random_cast(0, nan_fraction=0.05)
+    copies = [c.copy() for c in cast]
+    rsksproc.compensate_do(*cast, PATM)
+    for channel, copy in zip(cast, copies):
+        np.testing.assert_array_equal(channel, copy)
+
+
+@pytest.mark.parametrize("seed", range(20))
+def test_interp_pair_matches_np_interp(seed):
+    rng = np.random.default_rng(seed)
+    n = int(rng.integers(1, 50))
+    xp = np.sort(rng.normal(0, 10, n))
+    fp1 = rng.normal(0, 1, n)
+    fp2 = rng.normal(0, 1, n)
+    fp1[rng.random(n) < 0.1] = np.nan
+    # beyond both ends, exactly on the points, NaN abscissa
+    x = np.concatenate([rng.normal(0, 15, 100), xp, [np.nan]])
+    res1, res2 = rsksproc.interp_pair(x, xp, fp1, fp2)
+    np.testing.assert_array_equal(res1, np.interp(x, xp, fp1))
+    np.testing.assert_array_equal(res2, np.interp(x, xp, fp2))
@@ -0,0 +1,109 @@
+# -*- coding: utf-8 -*-
+"""
+score_profiles must select the same profile as the former per-cast loop of
+find_profile: highest pressure span of the downcast, the first one on a
+tie, the casts without valid pressure left out.
+"""
+import math
+
+import numpy as np
+import pytest
+
+import RSKsomlit_proc as rsksproc
+
+
+class Casts:
+    """
+    The part of an RSK object find_profile uses: data["sea_pressure"] and
+    getprofilesindices(direction="down")
+    """
+
+    def __init__(self, sea_pressure, castIndices):
+        self.data = np.zeros(len(sea_pressure), dtype=[("sea_pressure", "float64")])
+        self.data["sea_pressure"] = sea_pressure
+        self.castIndices = castIndices
+
+    def getprofilesindices(self, direction="both"):
+        return self.castIndices
+
+
+def reference_find_profile(rsk):
+    """
+    find_profile before score_profiles, cast by cast
+    """
+    liste = []
+    downcastIndices = rsk.getprofilesindices(direction="down")
+    for d in range(len(downcastIndices)):
+        i = downcastIndices[d]
+        for n in i:
+            if np.isnan(rsk.data[n]["sea_pressure"]):
+                continue
+            break
+        for k in list(reversed(i)):
+            if np.isnan(rsk.data[k]["sea_pressure"]):
+                continue
+            break
+        deltap = rsk.data[k]["sea_pressure"] - rsk.data[n]["sea_pressure"]
+        liste.append([d, deltap])
+    filtered = [pair for pair in liste if not math.isnan(pair[1])]
+    max_pair = max(filtered, key=lambda x: x[1])
+    return max_pair[0], [pair[1] for pair in liste]
+
+
+def random_casts(seed, ties=False):
+    """
+    Downcasts of a day: swell false casts of a few tens of cm and SOMLIT
+    profiles, noise, NaNs at the ends and inside some casts, one cast
+    without any valid pressure. With ties, two profiles have the same span.
+    """
+    rng = np.random.default_rng(seed)
+    n_casts = int(rng.integers(3, 12))
+    spans = rng.uniform(0.2, 1.0, n_casts)
+    profiles = rng.choice(n_casts, size=min(n_casts, int(rng.integers(1, 3))), replace=False)
+    spans[profiles] = rng.uniform(5, 20, profiles.size)
+
+    sea_pressure = []
+    castIndices = []
+    start = 0
+    for c in range(n_casts):
+        length = int(rng.integers(5, 200))
+        cast = np.linspace(0.3, 0.3 + spans[c], length) + rng.normal(0, 0.005, length)
+        # at most a third of the cast at each end, some values stay valid
+        if rng.random() < 0.3:
+            cast[: int(rng.integers(1, length // 3 + 1))] = np.nan
+        if rng.random() < 0.3:
+            cast[-int(rng.integers(1, length // 3 + 1)):] = np.nan
+        if rng.random() < 0.3:
+            cast[1:-1][rng.random(length - 2) < 0.2] = np.nan
+        sea_pressure.append(cast)
+        castIndices.append(list(range(start, start + length)))
+        start += length
+
+    # one cast with no valid pressure, never the first so that the former
+    # loop has valid values
+    nan_cast = int(rng.integers(1, n_casts))
+    sea_pressure[nan_cast][:] = np.nan
+
+    if ties:
+        # same first and last values, thus the same span, on two casts,
+        # deeper than the other profiles
+        a, b = rng.choice([c for c in range(n_casts) if c != nan_cast], size=2, replace=False)
+        for cast in (a, b):
+            sea_pressure[cast][:] = np.linspace(0.3, 25.3, len(sea_pressure[cast]))
+
+    return np.concatenate(sea_pressure), castIndices
+
+
+@pytest.mark.parametrize("seed", range(50))
+@pytest.mark.parametrize("ties", [False, True])
+def test_score_profiles_matches_reference(seed, ties):
+    sea_pressure, castIndices = random_casts(seed, ties)
+    rsk = Casts(sea_pressure, castIndices)
+    expected, deltas = reference_find_profile(rsk)
+
+    profile, scores = rsksproc.score_profiles(sea_pressure, castIndices)
+
+    assert profile == expected
+    assert rsksproc.find_profile(rsk) == expected
+    np.testing.assert_array_equal(scores["delta_p"].to_numpy(), np.array(deltas))
+    np.testing.assert_array_equal(scores["profile"].to_numpy(), np.arange(len(castIndices)))
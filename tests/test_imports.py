@@ -0,0 +1,24 @@
+# -*- coding: utf-8 -*-
+"""
+Importing the processing module must stay light: pyrsktools and matplotlib
+are imported in the functions that use them, cf. the module header of
+RSKsomlit_proc.py.
+"""
+import os
+import subprocess
+import sys
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+@pytest.mark.parametrize("module", ["RSKsomlit_proc", "RSKsomlit_batch"])
+def test_import_does_not_load_heavy_modules(module):
+    # a fresh interpreter, the other tests load these modules
+    code = (
+        f"import sys, {module}; "
+        "loaded = [m for m in ('matplotlib', 'pyrsktools') if m in sys.modules]; "
+        "assert not loaded, loaded"
+    )
+    subprocess.run([sys.executable, "-c", code], cwd=ROOT, check=True)